@@ -6,11 +6,14 @@ This module creates and configures the Flask application.
 
 import os
 import logging
+import logging.handlers
 from flask import Flask
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from dotenv import load_dotenv
 
 from .routes import listings_bp, users_bp, alerts_bp, scraping_bp, auth_bp
+from utils.auth import init_jwt
 
 # Load environment variables
 load_dotenv()
@@ -44,6 +47,9 @@ def create_app(config_name: str = None) -> Flask:
     app.register_blueprint(scraping_bp, url_prefix='/api/scraping')
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     
+    # JWT, shared managers and the subscription expiry sweeper
+    init_jwt(app)
+    
     # Register error handlers
     register_error_handlers(app)
     
@@ -143,8 +149,6 @@ def setup_logging(app: Flask):
     """
     if not app.debug:
         # Production logging
-        import logging.handlers
-        
         # Create logs directory if it doesn't exist
         log_dir = 'logs'
         if not os.path.exists(log_dir):
@@ -221,10 +225,23 @@ def register_error_handlers(app: Flask):
             'message': 'Access denied',
             'status_code': 403
         }, 403
+    
+    @app.errorhandler(Exception)
+    def unhandled_exception(error):
+        """Handle exceptions no route or helper caught"""
+        # HTTP errors keep their own status and the handlers above
+        if isinstance(error, HTTPException):
+            return error
+        
+        app.logger.exception(f'Unhandled Error: {error}')
+        return {
+            'error': 'Internal Server Error',
+            'message': 'An internal server error occurred',
+            'status_code': 500
+        }, 500
 
 
-# Create app instance for direct import
-app = create_app()
-
+# No module-level instance: importing api.app must not start the sweeper
+# or open the database. Servers call the factory ("api.app:create_app()").
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    create_app().run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
@@ -9,6 +9,7 @@ import logging
 from typing import Dict, Any, List
 from datetime import datetime
 from flask import Blueprint, request, jsonify, send_file
+from flask_jwt_extended import jwt_required
 from io import BytesIO
 import pandas as pd
 
@@ -203,6 +204,19 @@ def get_listings_statistics():
         return jsonify({'error': 'Internal server error'}), 500
 
 
+# Shared so the analyzer's trend cache is reused across requests
+_trend_analyzer = None
+
+
+def get_trend_analyzer():
+    """Get the shared PriceTrendAnalyzer, creating it on first use"""
+    global _trend_analyzer
+    if _trend_analyzer is None:
+        from utils.trends import PriceTrendAnalyzer
+        _trend_analyzer = PriceTrendAnalyzer(db_manager)
+    return _trend_analyzer
+
+
 @listings_bp.route('/trends', methods=['GET'])
 def get_price_trends():
     """
@@ -214,14 +228,12 @@ def get_price_trends():
     - include_deals: Include deal analysis (default: true)
     """
     try:
-        from utils.trends import PriceTrendAnalyzer
-        
         location = request.args.get('location')
         days = request.args.get('days', 30, type=int)
         include_deals = request.args.get('include_deals', 'true').lower() == 'true'
         
         # Use our new trend analyzer
-        analyzer = PriceTrendAnalyzer(db_manager)
+        analyzer = get_trend_analyzer()
         
         if location:
             # Get trends for specific location
@@ -537,6 +549,7 @@ def login():
 
 
 @auth_bp.route('/profile', methods=['GET'])
+@jwt_required()
 def get_profile():
     """Get user profile"""
     from utils.auth import profile_handler
@@ -544,6 +557,7 @@ def get_profile():
 
 
 @auth_bp.route('/upgrade', methods=['POST'])
+@jwt_required()
 def upgrade_tier():
     """Upgrade user tier"""
     from utils.auth import upgrade_tier_handler
@@ -8,6 +8,7 @@ import os
 import sys
 import logging
 import asyncio
+import orjson
 from dotenv import load_dotenv
 
 # Add project root to Python path
@@ -137,6 +138,9 @@ def run_sample_scraping():
             
             # Save to database
             for listing in listings:
+                # Store raw_data as JSON so PropertyListing.to_dict() can read it back
+                raw_data = orjson.dumps(listing.raw_data, option=orjson.OPT_NON_STR_KEYS).decode()
+                
                 listing_data = {
                     'title': listing.title,
                     'location': listing.location,
@@ -150,7 +154,7 @@ def run_sample_scraping():
                     'bathrooms': listing.bathrooms,
                     'timestamp': listing.timestamp,
                     'source': listing.source,
-                    'raw_data': str(listing.raw_data)
+                    'raw_data': raw_data
                 }
                 db_manager.insert_listing(listing_data)
             
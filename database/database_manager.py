@@ -5,16 +5,174 @@ This module provides a high-level interface for database operations.
 """
 
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, NamedTuple, Iterable
 from datetime import datetime, timedelta
-from sqlalchemy import create_engine, and_, or_, desc, func
+from sqlalchemy import create_engine, and_, or_, desc, func, update, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import SQLAlchemyError
 
-from .models import Base, PropertyListing, User, Alert, ScrapingLog
+from .models import Base, PropertyListing, LocationStats, User, Alert, ScrapingLog, TierEnum, TIER_NAMES
 
 logger = logging.getLogger(__name__)
 
+# Locations refreshed per statement, below SQLite's bound-parameter limit
+LOCATION_STATS_BATCH_SIZE = 500
+
+# INSERT constructs supporting ON CONFLICT, by dialect name
+UPSERT_INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert
+}
+
+
+class UserAuth(NamedTuple):
+    """Columns needed to authenticate a user"""
+    id: int
+    username: str
+    email: str
+    password: str
+    is_active: bool
+    tier_id: int
+    subscription_expires: Optional[datetime]
+    
+    @property
+    def subscription_tier(self) -> str:
+        """Tier name (free, pro, enterprise)"""
+        return TIER_NAMES[self.tier_id]
+
+
+def _upsert_location_stats(session: Session, rows: List[Dict[str, Any]], accumulate: bool):
+    """
+    Write location_stats rows with INSERT ... ON CONFLICT DO UPDATE
+    
+    The conflict update runs under the row lock, so concurrent writers
+    for the same location do not lose each other's counts.
+    
+    Args:
+        session: Session to write statistics in
+        rows: Rows with location, n, sum_price, sum_sq_price, avg_price and updated_at
+        accumulate: Add the rows to the stored sums instead of replacing them
+    """
+    if not rows:
+        return
+    
+    stmt = UPSERT_INSERTS[session.get_bind().dialect.name](LocationStats)
+    excluded = stmt.excluded
+    if accumulate:
+        n = LocationStats.n + excluded.n
+        sum_price = LocationStats.sum_price + excluded.sum_price
+        values = {
+            'n': n,
+            'sum_price': sum_price,
+            'sum_sq_price': LocationStats.sum_sq_price + excluded.sum_sq_price,
+            'avg_price': sum_price / n,
+            'updated_at': excluded.updated_at
+        }
+    else:
+        values = {
+            column: excluded[column]
+            for column in ('n', 'sum_price', 'sum_sq_price', 'avg_price', 'updated_at')
+        }
+    
+    session.execute(
+        stmt.on_conflict_do_update(index_elements=[LocationStats.location], set_=values),
+        rows
+    )
+
+
+def add_location_stats(session: Session, listings: Iterable[PropertyListing]) -> int:
+    """
+    Add newly inserted listings to location_stats, without committing
+    
+    Args:
+        session: Session the listings were inserted in
+        listings: Listings not yet counted in location_stats
+        
+    Returns:
+        int: Number of locations updated
+    """
+    sums = {}
+    for listing in listings:
+        n, total, total_sq = sums.get(listing.location, (0, 0.0, 0.0))
+        price = listing.price_per_m2
+        sums[listing.location] = (n + 1, total + price, total_sq + price * price)
+    
+    now = datetime.utcnow()
+    rows = [
+        {
+            'location': location,
+            'n': n,
+            'sum_price': total,
+            'sum_sq_price': total_sq,
+            'avg_price': total / n,
+            'updated_at': now
+        }
+        for location, (n, total, total_sq) in sums.items()
+    ]
+    _upsert_location_stats(session, rows, accumulate=True)
+    
+    return len(rows)
+
+
+def write_location_stats(session: Session, locations: Optional[Iterable[str]] = None) -> int:
+    """
+    Recompute location_stats rows inside an open session, without committing
+    
+    Replaces the stored sums with ones aggregated from the listings table,
+    correcting any drift from listings changed outside the insert paths.
+    Locations with no listings left are removed.
+    
+    Args:
+        session: Session to read listings and write statistics in
+        locations: Locations to refresh; all locations when None
+        
+    Returns:
+        int: Number of locations written
+    """
+    if locations is None:
+        batches = [None]
+    else:
+        unique = sorted(set(locations))
+        batches = [
+            unique[i:i + LOCATION_STATS_BATCH_SIZE]
+            for i in range(0, len(unique), LOCATION_STATS_BATCH_SIZE)
+        ]
+    
+    now = datetime.utcnow()
+    written = 0
+    for batch in batches:
+        sums = session.query(
+            PropertyListing.location,
+            func.count(PropertyListing.id),
+            func.sum(PropertyListing.price_per_m2),
+            func.sum(PropertyListing.price_per_m2 * PropertyListing.price_per_m2)
+        )
+        stale = delete(LocationStats).where(
+            LocationStats.location.not_in(select(PropertyListing.location))
+        )
+        if batch is not None:
+            sums = sums.filter(PropertyListing.location.in_(batch))
+            stale = stale.where(LocationStats.location.in_(batch))
+        
+        rows = [
+            {
+                'location': location,
+                'n': n,
+                'sum_price': total,
+                'sum_sq_price': total_sq,
+                'avg_price': total / n,
+                'updated_at': now
+            }
+            for location, n, total, total_sq in sums.group_by(PropertyListing.location).all()
+        ]
+        
+        session.execute(stale)
+        _upsert_location_stats(session, rows, accumulate=False)
+        written += len(rows)
+    
+    return written
+
 
 class DatabaseManager:
     """
@@ -73,6 +231,8 @@ class DatabaseManager:
                 # Create new listing
                 listing = PropertyListing(**listing_data)
                 session.add(listing)
+                session.flush()
+                add_location_stats(session, [listing])
                 session.commit()
                 session.refresh(listing)
                 
@@ -94,6 +254,7 @@ class DatabaseManager:
             int: Number of new listings inserted
         """
         inserted_count = 0
+        inserted = []
         
         try:
             with self.get_session() as session:
@@ -106,8 +267,13 @@ class DatabaseManager:
                     if not existing:
                         listing = PropertyListing(**listing_data)
                         session.add(listing)
+                        inserted.append(listing)
                         inserted_count += 1
                 
+                # Add the new listings to their locations' statistics in the
+                # same transaction as the inserts
+                session.flush()
+                add_location_stats(session, inserted)
                 session.commit()
                 logger.info(f"Inserted {inserted_count} new listings")
                 
@@ -117,6 +283,32 @@ class DatabaseManager:
         
         return inserted_count
     
+    def refresh_location_stats(self, locations: Optional[Iterable[str]] = None) -> int:
+        """
+        Recompute location_stats rows from the listings table
+        
+        Inserts add to the stored sums as they go; this reconciles them
+        after listings are changed or deleted elsewhere, and is run before
+        each trend analysis.
+        
+        Args:
+            locations: Locations to refresh; all locations when None
+            
+        Returns:
+            int: Number of locations written
+        """
+        try:
+            with self.get_session() as session:
+                written = write_location_stats(session, locations)
+                session.commit()
+                
+                logger.info(f"Refreshed statistics for {written} locations")
+                return written
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Error refreshing location stats: {e}")
+            return 0
+    
     def get_listings(
         self,
         location: Optional[str] = None,
@@ -236,16 +428,17 @@ class DatabaseManager:
         Create a new user
         
         Args:
-            email: User email
+            email: User email, stored lowercased
             name: User name
             
         Returns:
             User: The created user or None if failed
         """
+        email = email.lower()
         try:
             with self.get_session() as session:
                 # Check if user already exists
-                existing = session.query(User).filter(User.email == email).first()
+                existing = session.query(User).filter(func.lower(User.email) == email).first()
                 if existing:
                     logger.warning(f"User already exists: {email}")
                     return existing
@@ -264,7 +457,7 @@ class DatabaseManager:
     
     def get_user_by_email(self, email: str) -> Optional[User]:
         """
-        Get user by email
+        Get user by email, matching case-insensitively
         
         Args:
             email: User email
@@ -274,12 +467,145 @@ class DatabaseManager:
         """
         try:
             with self.get_session() as session:
-                return session.query(User).filter(User.email == email).first()
+                return session.query(User).filter(func.lower(User.email) == email.lower()).first()
                 
         except SQLAlchemyError as e:
             logger.error(f"Error getting user by email: {e}")
             return None
     
+    def get_user_by_id(self, user_id: int) -> Optional[User]:
+        """
+        Get user by ID
+        
+        Args:
+            user_id: User ID
+            
+        Returns:
+            User: The user or None if not found
+        """
+        try:
+            with self.get_session() as session:
+                return session.get(User, int(user_id))
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Error getting user by ID: {e}")
+            return None
+    
+    def update_user(self, user: User) -> bool:
+        """
+        Save changes made to a user loaded by another session
+        
+        Args:
+            user: User with modified attributes
+            
+        Returns:
+            bool: True if successful
+        """
+        try:
+            with self.get_session() as session:
+                session.merge(user)
+                session.commit()
+                return True
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Error updating user: {e}")
+            return False
+    
+    def get_user_auth_tuple(self, email: str) -> Optional[UserAuth]:
+        """
+        Get only the columns needed for login, matching email case-insensitively
+        
+        Args:
+            email: User email
+            
+        Returns:
+            UserAuth: The user's auth columns or None if not found
+        """
+        try:
+            with self.get_session() as session:
+                row = session.query(
+                    User.id,
+                    User.username,
+                    User.email,
+                    User.password,
+                    User.is_active,
+                    User.tier_id,
+                    User.subscription_expires
+                ).filter(func.lower(User.email) == email.lower()).first()
+                
+                return UserAuth(*row) if row else None
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Error getting user auth data: {e}")
+            return None
+    
+    def get_user_tier_id(self, user_id: int) -> Optional[int]:
+        """
+        Get only a user's current tier
+        
+        Args:
+            user_id: User ID
+            
+        Returns:
+            int: The user's tier_id or None if not found
+        """
+        try:
+            with self.get_session() as session:
+                return session.query(User.tier_id).filter(User.id == int(user_id)).scalar()
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Error getting user tier: {e}")
+            return None
+    
+    def update_user_password(self, user_id: int, password_hash: str) -> bool:
+        """
+        Replace a user's stored password hash
+        
+        Args:
+            user_id: User ID
+            password_hash: New password hash
+            
+        Returns:
+            bool: True if successful
+        """
+        try:
+            with self.get_session() as session:
+                updated = session.query(User).filter(User.id == user_id).update(
+                    {User.password: password_hash}
+                )
+                session.commit()
+                return updated > 0
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Error updating user password: {e}")
+            return False
+    
+    def downgrade_expired_subscriptions(self) -> List[int]:
+        """
+        Move every user whose subscription has lapsed back to the free tier
+        
+        Returns:
+            List[int]: IDs of the downgraded users
+        """
+        try:
+            with self.get_session() as session:
+                result = session.execute(
+                    update(User)
+                    .where(and_(
+                        User.subscription_expires < datetime.utcnow(),
+                        User.tier_id != TierEnum.FREE
+                    ))
+                    .values(tier_id=TierEnum.FREE, subscription_expires=None)
+                    .returning(User.id)
+                )
+                user_ids = [row.id for row in result]
+                session.commit()
+                return user_ids
+                
+        except SQLAlchemyError as e:
+            logger.error(f"Error downgrading expired subscriptions: {e}")
+            return []
+    
     # Alert Operations
     
     def create_alert(self, user_id: int, alert_data: Dict[str, Any]) -> Optional[Alert]:
@@ -4,16 +4,25 @@ Database Migrations
 This module handles database schema migrations and updates.
 """
 
+import ast
+import json
 import logging
 from typing import List, Dict, Any
 from sqlalchemy import text, inspect
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
 
-from .models import Base
-from .database_manager import DatabaseManager
+from .models import Base, TierEnum
+from .database_manager import DatabaseManager, write_location_stats
 
 logger = logging.getLogger(__name__)
 
+# Keys the old raw_data-based flag_deals wrote; is_deal/deal_score columns replace them
+LEGACY_DEAL_KEYS = ('is_deal', 'deal_score', 'avg_price_location')
+
+# Rows converted per batch by data migrations
+MIGRATION_BATCH_SIZE = 1000
+
 
 class MigrationManager:
     """
@@ -53,6 +62,43 @@ class MigrationManager:
                 'version': 4,
                 'name': 'Add lat/lng coordinates',
                 'sql': self._get_coordinates_migrations()
+            },
+            {
+                'version': 5,
+                'name': 'Add Stripe columns to users',
+                'sql': self._get_stripe_columns_migrations()
+            },
+            {
+                'version': 6,
+                'name': 'Add case-insensitive email index',
+                'sql': self._get_email_index_migrations()
+            },
+            {
+                'version': 7,
+                'name': 'Store subscription tier as an integer',
+                'sql': self._get_tier_id_migrations()
+            },
+            {
+                'version': 8,
+                'name': 'Add deal flag columns',
+                'sql': self._get_deal_columns_migrations()
+            },
+            {
+                'version': 9,
+                'name': 'Store listing raw_data as JSON',
+                'sql': [],
+                'python': [self._convert_raw_data_to_json]
+            },
+            {
+                'version': 10,
+                'name': 'Add location/timestamp index for trends',
+                'sql': self._get_trend_index_migrations()
+            },
+            {
+                'version': 11,
+                'name': 'Add location_stats table',
+                'sql': self._get_location_stats_migrations(),
+                'python': [self._seed_location_stats]
             }
         ]
     
@@ -150,6 +196,121 @@ class MigrationManager:
             "ALTER TABLE property_listings ADD COLUMN lng FLOAT"
         ]
     
+    def _get_stripe_columns_migrations(self) -> List[str]:
+        """Get SQL for the Stripe IDs stored on users"""
+        return [
+            "ALTER TABLE users ADD COLUMN stripe_customer_id VARCHAR(100)",
+            "ALTER TABLE users ADD COLUMN subscription_id VARCHAR(100)"
+        ]
+    
+    def _get_email_index_migrations(self) -> List[str]:
+        """Get SQL for the case-insensitive email lookup and uniqueness"""
+        return [
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_lower ON users(lower(email))"
+        ]
+    
+    def _get_tier_id_migrations(self) -> List[str]:
+        """Get SQL replacing users.subscription_tier with a TierEnum tier_id"""
+        return [
+            "ALTER TABLE users ADD COLUMN tier_id SMALLINT NOT NULL DEFAULT 0",
+            """
+            UPDATE users SET tier_id = CASE subscription_tier
+                WHEN 'pro' THEN 1
+                WHEN 'enterprise' THEN 2
+                ELSE 0
+            END
+            """,
+            "ALTER TABLE users DROP COLUMN subscription_tier"
+        ]
+    
+    def _get_deal_columns_migrations(self) -> List[str]:
+        """Get SQL for the columns flag_deals writes instead of raw_data"""
+        return [
+            "ALTER TABLE property_listings ADD COLUMN is_deal BOOLEAN DEFAULT 0",
+            "ALTER TABLE property_listings ADD COLUMN deal_score FLOAT"
+        ]
+    
+    def _get_trend_index_migrations(self) -> List[str]:
+        """Get SQL for the index trend analysis reads listings through"""
+        return [
+            "CREATE INDEX IF NOT EXISTS idx_listings_location_timestamp ON property_listings(location, timestamp)"
+        ]
+    
+    def _get_location_stats_migrations(self) -> List[str]:
+        """Get SQL for the per-location statistics flag_deals reads"""
+        return [
+            """
+            CREATE TABLE IF NOT EXISTS location_stats (
+                location VARCHAR(200) PRIMARY KEY,
+                n INTEGER NOT NULL,
+                sum_price FLOAT NOT NULL,
+                sum_sq_price FLOAT NOT NULL,
+                avg_price FLOAT NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL
+            )
+            """
+        ]
+    
+    def _seed_location_stats(self, session: Session):
+        """
+        Fill location_stats from the listings already in the database
+        
+        Args:
+            session: Session the migration runs in
+        """
+        written = write_location_stats(session)
+        logger.info(f"Seeded location statistics for {written} locations")
+    
+    def _convert_raw_data_to_json(self, session: Session):
+        """
+        Rewrite raw_data stored as a Python dict repr as JSON
+        
+        Older code wrote str(dict) and read it back with eval(). Those rows
+        are parsed once with ast.literal_eval, stripped of the old deal
+        keys and saved as JSON; rows that are already JSON are left alone.
+        
+        Args:
+            session: Session the migration runs in
+        """
+        result = session.execute(
+            text("SELECT id, raw_data FROM property_listings WHERE raw_data IS NOT NULL"),
+            execution_options={'stream_results': True}
+        )
+        
+        converted = 0
+        for rows in result.partitions(MIGRATION_BATCH_SIZE):
+            updates = []
+            for listing_id, raw_data in rows:
+                try:
+                    json.loads(raw_data)
+                    continue
+                except ValueError:
+                    pass
+                
+                try:
+                    data = ast.literal_eval(raw_data)
+                except (ValueError, SyntaxError):
+                    logger.warning(f"Leaving unparseable raw_data on listing {listing_id}")
+                    continue
+                
+                if isinstance(data, dict):
+                    for key in LEGACY_DEAL_KEYS:
+                        data.pop(key, None)
+                
+                updates.append({
+                    'id': listing_id,
+                    'raw_data': json.dumps(data, ensure_ascii=False, default=str)
+                })
+            
+            if updates:
+                session.execute(
+                    text("UPDATE property_listings SET raw_data = :raw_data WHERE id = :id"),
+                    updates
+                )
+                converted += len(updates)
+        
+        logger.info(f"Converted raw_data to JSON for {converted} listings")
+    
     def get_migration_table_sql(self) -> str:
         """Get SQL to create migration tracking table"""
         return """
@@ -193,6 +354,10 @@ class MigrationManager:
                 for sql in migration['sql']:
                     session.execute(text(sql))
                 
+                # Run data migrations that need Python
+                for step in migration.get('python', []):
+                    step(session)
+                
                 # Record migration
                 session.execute(
                     text("INSERT INTO migrations (version, name) VALUES (:version, :name)"),
@@ -258,13 +423,13 @@ class MigrationManager:
                 # Create sample user
                 session.execute(
                     text("""
-                        INSERT INTO users (email, name, subscription_tier)
-                        VALUES (:email, :name, :tier)
+                        INSERT INTO users (email, name, tier_id)
+                        VALUES (:email, :name, :tier_id)
                     """),
                     {
                         'email': 'demo@example.com',
                         'name': 'Demo User',
-                        'tier': 'pro'
+                        'tier_id': int(TierEnum.PRO)
                     }
                 )
                 
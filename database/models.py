@@ -4,15 +4,29 @@ Database Models
 This module defines the SQLAlchemy models for the real estate scraper.
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, Text, ForeignKey
+from sqlalchemy import create_engine, Column, Integer, SmallInteger, String, Float, DateTime, Boolean, Text, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
-import json
+import enum
+import math
+import orjson
 
 Base = declarative_base()
 
 
+class TierEnum(enum.IntEnum):
+    """Subscription tiers, stored in users.tier_id"""
+    FREE = 0
+    PRO = 1
+    ENTERPRISE = 2
+
+
+# API tier names indexed by tier_id, and the reverse lookup
+TIER_NAMES = tuple(tier.name.lower() for tier in TierEnum)
+TIER_IDS = {name: tier_id for tier_id, name in enumerate(TIER_NAMES)}
+
+
 class PropertyListing(Base):
     """Database model for property listings"""
     
@@ -34,6 +48,8 @@ class PropertyListing(Base):
     timestamp = Column(DateTime, default=datetime.utcnow, nullable=False)
     source = Column(String(50), nullable=False)
     raw_data = Column(Text)  # JSON string for additional data
+    is_deal = Column(Boolean, default=False)  # Set by PriceTrendAnalyzer.flag_deals
+    deal_score = Column(Float)  # % below the location average, for deals
     
     def __repr__(self):
         return f"<PropertyListing(id={self.id}, title='{self.title}', price={self.price})>"
@@ -43,8 +59,8 @@ class PropertyListing(Base):
         raw_data_dict = {}
         if self.raw_data:
             try:
-                raw_data_dict = json.loads(self.raw_data)
-            except (json.JSONDecodeError, TypeError):
+                raw_data_dict = orjson.loads(self.raw_data)
+            except (orjson.JSONDecodeError, TypeError):
                 raw_data_dict = {'raw_data': self.raw_data}
         
         return {
@@ -63,10 +79,46 @@ class PropertyListing(Base):
             'bathrooms': self.bathrooms,
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'source': self.source,
+            'is_deal': bool(self.is_deal),
+            'deal_score': self.deal_score,
             'raw_data': raw_data_dict
         }
 
 
+class LocationStats(Base):
+    """Per-location price statistics, accumulated as listings are ingested"""
+    
+    __tablename__ = 'location_stats'
+    
+    location = Column(String(200), primary_key=True)
+    n = Column(Integer, nullable=False)  # Number of listings
+    sum_price = Column(Float, nullable=False)  # Σ price per m²
+    sum_sq_price = Column(Float, nullable=False)  # Σ (price per m²)²
+    avg_price = Column(Float, nullable=False)  # Mean price per m²
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    
+    @property
+    def std_price(self):
+        """Sample std of price per m², None for a single listing"""
+        if self.n < 2:
+            return None
+        variance = (self.sum_sq_price - self.sum_price * self.sum_price / self.n) / (self.n - 1)
+        return math.sqrt(max(variance, 0.0))
+    
+    def __repr__(self):
+        return f"<LocationStats(location='{self.location}', n={self.n}, avg_price={self.avg_price})>"
+    
+    def to_dict(self):
+        """Convert model to dictionary"""
+        return {
+            'location': self.location,
+            'n': self.n,
+            'avg_price': self.avg_price,
+            'std_price': self.std_price,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
 class User(Base):
     """Database model for users"""
     
@@ -79,12 +131,23 @@ class User(Base):
     name = Column(String(100), nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    subscription_tier = Column(String(20), default='free')  # free, pro, enterprise
+    tier_id = Column(SmallInteger, default=TierEnum.FREE, nullable=False)  # TierEnum value
     subscription_expires = Column(DateTime)
+    stripe_customer_id = Column(String(100))
+    subscription_id = Column(String(100))  # Stripe subscription
     
     # Relationships
     alerts = relationship("Alert", back_populates="user")
     
+    @property
+    def subscription_tier(self) -> str:
+        """Tier name (free, pro, enterprise)"""
+        return TIER_NAMES[self.tier_id or TierEnum.FREE]
+    
+    @subscription_tier.setter
+    def subscription_tier(self, tier: str):
+        self.tier_id = TIER_IDS[tier]
+    
     def __repr__(self):
         return f"<User(id={self.id}, email='{self.email}', tier='{self.subscription_tier}')>"
     
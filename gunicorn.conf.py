@@ -0,0 +1,25 @@
+"""
+Gunicorn Configuration
+
+Runs the API on gevent workers so webhook handling and database I/O
+yield instead of tying up a worker.
+
+Usage:
+    gunicorn -c gunicorn.conf.py "api.app:create_app()"
+"""
+
+# Patch before anything else imports ssl/socket, otherwise requests made
+# by stripe can hit gevent's SSL recursion error
+from gevent import monkey
+monkey.patch_all()
+
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+worker_class = 'gevent'
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+timeout = 30
+accesslog = '-'
+errorlog = '-'
@@ -19,7 +19,7 @@ from playwright.async_api import async_playwright, Browser, Page
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class PropertyListing:
     """Data class for property listing information"""
     title: str
@@ -6,7 +6,7 @@ This module implements scraping functionality for batdongsan.com.vn
 
 import asyncio
 import logging
-from typing import List, Optional, Any
+from typing import List, Dict, Optional, Any
 from datetime import datetime
 from urllib.parse import urljoin
 from playwright.async_api import async_playwright, Page
@@ -222,43 +222,50 @@ class BatDongSanScraper(BaseScraper):
 
 
 # Sample data for testing and development
-SAMPLE_BATDONGSAN_DATA = [
-    {
-        "title": "Căn hộ 2 phòng ngủ tại Quận 1, TP.HCM",
-        "location": "Quận 1, TP.HCM",
-        "price": 2500000000,  # 2.5 billion VND
-        "area": 65.0,  # 65 m²
-        "price_per_m2": 38461538.46,
-        "image_url": "https://example.com/image1.jpg",
-        "link": "https://batdongsan.com.vn/ban-can-ho/can-ho-2-phong-ngu-quan-1",
-        "property_type": "Căn hộ",
-        "bedrooms": 2,
-        "bathrooms": 2,
-        "timestamp": datetime.now(),
-        "source": "BatDongSan",
-        "raw_data": {
-            "price_text": "2.5 tỷ",
-            "area_text": "65m²",
-            "property_type": "Căn hộ"
-        }
-    },
-    {
-        "title": "Nhà riêng 3 tầng tại Quận 3, TP.HCM",
-        "location": "Quận 3, TP.HCM", 
-        "price": 8500000000,  # 8.5 billion VND
-        "area": 120.0,  # 120 m²
-        "price_per_m2": 70833333.33,
-        "image_url": "https://example.com/image2.jpg",
-        "link": "https://batdongsan.com.vn/ban-nha-rieng/nha-rieng-3-tang-quan-3",
-        "property_type": "Nhà riêng",
-        "bedrooms": 4,
-        "bathrooms": 3,
-        "timestamp": datetime.now(),
-        "source": "BatDongSan",
-        "raw_data": {
-            "price_text": "8.5 tỷ",
-            "area_text": "120m²",
-            "property_type": "Nhà riêng"
+def get_sample_batdongsan_data() -> List[Dict[str, Any]]:
+    """
+    Build sample BatDongSan listings for testing and development
+    
+    Returns:
+        List[Dict[str, Any]]: Sample listing data timestamped at call time
+    """
+    return [
+        {
+            "title": "Căn hộ 2 phòng ngủ tại Quận 1, TP.HCM",
+            "location": "Quận 1, TP.HCM",
+            "price": 2500000000,  # 2.5 billion VND
+            "area": 65.0,  # 65 m²
+            "price_per_m2": 38461538.46,
+            "image_url": "https://example.com/image1.jpg",
+            "link": "https://batdongsan.com.vn/ban-can-ho/can-ho-2-phong-ngu-quan-1",
+            "property_type": "Căn hộ",
+            "bedrooms": 2,
+            "bathrooms": 2,
+            "timestamp": datetime.now(),
+            "source": "BatDongSan",
+            "raw_data": {
+                "price_text": "2.5 tỷ",
+                "area_text": "65m²",
+                "property_type": "Căn hộ"
+            }
+        },
+        {
+            "title": "Nhà riêng 3 tầng tại Quận 3, TP.HCM",
+            "location": "Quận 3, TP.HCM", 
+            "price": 8500000000,  # 8.5 billion VND
+            "area": 120.0,  # 120 m²
+            "price_per_m2": 70833333.33,
+            "image_url": "https://example.com/image2.jpg",
+            "link": "https://batdongsan.com.vn/ban-nha-rieng/nha-rieng-3-tang-quan-3",
+            "property_type": "Nhà riêng",
+            "bedrooms": 4,
+            "bathrooms": 3,
+            "timestamp": datetime.now(),
+            "source": "BatDongSan",
+            "raw_data": {
+                "price_text": "8.5 tỷ",
+                "area_text": "120m²",
+                "property_type": "Nhà riêng"
+            }
         }
-    }
-] 
\ No newline at end of file
+    ]
@@ -6,7 +6,8 @@ This module implements scraping functionality for chotot.com
 
 import asyncio
 import logging
-from typing import List, Optional, Any
+import re
+from typing import List, Dict, Optional, Any, AsyncIterator
 from datetime import datetime
 from urllib.parse import urljoin
 from playwright.async_api import async_playwright, Page
@@ -15,6 +16,8 @@ from .base_scraper import BaseScraper, PropertyListing
 
 logger = logging.getLogger(__name__)
 
+NUMBER_PATTERN = re.compile(r'\d+')
+
 
 class ChototScraper(BaseScraper):
     """
@@ -57,6 +60,24 @@ class ChototScraper(BaseScraper):
             List[PropertyListing]: List of scraped property listings
         """
         listings = []
+        async for batch in self.iter_listing_batches(max_pages):
+            listings.extend(batch)
+        return listings
+    
+    async def iter_listing_batches(self, max_pages: int = 10) -> AsyncIterator[List[PropertyListing]]:
+        """
+        Scrape property listings from Chotot one page at a time
+        
+        Yielding per page lets callers persist each page in a single
+        batch insert instead of waiting for the whole run.
+        
+        Args:
+            max_pages: Maximum number of pages to scrape
+            
+        Yields:
+            List[PropertyListing]: Listings scraped from one page
+        """
+        seen_links = set()
         
         async with async_playwright() as p:
             browser = await p.chromium.launch(headless=True)
@@ -73,36 +94,54 @@ class ChototScraper(BaseScraper):
                 await page.goto(start_url, wait_until='networkidle')
                 await self.respectful_delay()
                 
+                listing_selector = self.selectors['listing_container']
+                next_page_selector = self.selectors['next_page']
+                
                 page_num = 1
                 while page_num <= max_pages:
-                    logger.info(f"Scraping page {page_num} from Chotot")
+                    logger.info("Scraping page %d from Chotot", page_num)
                     
                     # Wait for listings to load
                     try:
-                        await page.wait_for_selector(self.selectors['listing_container'], timeout=10000)
+                        await page.wait_for_selector(listing_selector, timeout=10000)
                     except:
-                        logger.warning(f"No listings found on page {page_num}")
+                        logger.warning("No listings found on page %d", page_num)
                         break
                     
                     # Get all listing elements
-                    listing_elements = await page.query_selector_all(self.selectors['listing_container'])
+                    listing_elements = await page.query_selector_all(listing_selector)
                     
                     if not listing_elements:
-                        logger.warning(f"No listing elements found on page {page_num}")
+                        logger.warning("No listing elements found on page %d", page_num)
                         break
                     
-                    # Parse each listing
-                    for element in listing_elements:
-                        try:
-                            listing = await self.parse_listing_async(page, element)
-                            if listing:
-                                listings.append(listing)
-                        except Exception as e:
-                            logger.error(f"Error parsing listing: {e}")
+                    # All listings on a page share one scrape timestamp
+                    now = datetime.now()
+                    
+                    # Parse all listings on the page concurrently; each one
+                    # is a chain of browser round trips, not a site request.
+                    # parse_listing_async logs its own errors and returns None.
+                    results = await asyncio.gather(
+                        *(self.parse_listing_async(page, element, now) for element in listing_elements)
+                    )
+                    
+                    batch = []
+                    for listing in results:
+                        if not listing:
                             continue
+                        # New ads push older ones onto the next page, so
+                        # the same listing can show up twice in one run
+                        if listing.link:
+                            if listing.link in seen_links:
+                                continue
+                            seen_links.add(listing.link)
+                        batch.append(listing)
+                    
+                    if batch:
+                        yield batch
                     
                     # Check if there's a next page
-                    next_button = await page.query_selector(self.selectors['next_page'])
+                    next_button = await page.query_selector(next_page_selector)
                     if not next_button or page_num >= max_pages:
                         break
                     
@@ -113,77 +152,82 @@ class ChototScraper(BaseScraper):
                     page_num += 1
                     
             except Exception as e:
-                logger.error(f"Error during Chotot scraping: {e}")
+                logger.error("Error during Chotot scraping: %s", e)
                 
             finally:
                 await browser.close()
-        
-        return listings
     
-    async def parse_listing_async(self, page: Page, element: Any) -> Optional[PropertyListing]:
+    async def parse_listing_async(
+        self,
+        page: Page,
+        element: Any,
+        now: Optional[datetime] = None
+    ) -> Optional[PropertyListing]:
         """
         Parse a listing element asynchronously
         
         Args:
             page: Playwright page object
             element: Listing element
+            now: Scrape timestamp for the listing (defaults to the current time)
             
         Returns:
             Optional[PropertyListing]: Parsed listing or None
         """
+        selectors = self.selectors
+        base_url = self.base_url
+        
         try:
             # Extract title and link
-            title_element = await element.query_selector(self.selectors['title'])
+            title_element = await element.query_selector(selectors['title'])
             title = await title_element.text_content() if title_element else "No title"
             
-            link_element = await element.query_selector(self.selectors['listing_link'])
+            link_element = await element.query_selector(selectors['listing_link'])
             link = await link_element.get_attribute('href') if link_element else ""
             if link and not link.startswith('http'):
-                link = urljoin(self.base_url, link)
+                link = base_url + link if self._is_root_relative(link) else urljoin(base_url, link)
             
             # Extract price
-            price_element = await element.query_selector(self.selectors['price'])
+            price_element = await element.query_selector(selectors['price'])
             price_text = await price_element.text_content() if price_element else "0"
             price = self.clean_price(price_text)
             
             # Extract area
-            area_element = await element.query_selector(self.selectors['area'])
+            area_element = await element.query_selector(selectors['area'])
             area_text = await area_element.text_content() if area_element else "0"
             area = self.clean_area(area_text)
             
             # Extract location
-            location_element = await element.query_selector(self.selectors['location'])
+            location_element = await element.query_selector(selectors['location'])
             location = await location_element.text_content() if location_element else "Unknown"
             
             # Extract image
-            image_element = await element.query_selector(self.selectors['image'])
+            image_element = await element.query_selector(selectors['image'])
             image_url = await image_element.get_attribute('src') if image_element else None
             if image_url and not image_url.startswith('http'):
-                image_url = urljoin(self.base_url, image_url)
+                image_url = base_url + image_url if self._is_root_relative(image_url) else urljoin(base_url, image_url)
             
             # Extract property type
-            type_element = await element.query_selector(self.selectors['property_type'])
+            type_element = await element.query_selector(selectors['property_type'])
             property_type = await type_element.text_content() if type_element else "Unknown"
             
             # Extract bedrooms (if available)
-            bedroom_element = await element.query_selector(self.selectors['bedrooms'])
+            bedroom_element = await element.query_selector(selectors['bedrooms'])
             bedrooms = None
             if bedroom_element:
                 bedroom_text = await bedroom_element.text_content()
                 if bedroom_text:
-                    import re
-                    numbers = re.findall(r'\d+', bedroom_text)
+                    numbers = NUMBER_PATTERN.findall(bedroom_text)
                     if numbers:
                         bedrooms = int(numbers[0])
             
             # Extract bathrooms (if available)
-            bathroom_element = await element.query_selector(self.selectors['bathrooms'])
+            bathroom_element = await element.query_selector(selectors['bathrooms'])
             bathrooms = None
             if bathroom_element:
                 bathroom_text = await bathroom_element.text_content()
                 if bathroom_text:
-                    import re
-                    numbers = re.findall(r'\d+', bathroom_text)
+                    numbers = NUMBER_PATTERN.findall(bathroom_text)
                     if numbers:
                         bathrooms = int(numbers[0])
             
@@ -202,7 +246,7 @@ class ChototScraper(BaseScraper):
                 property_type=property_type.strip(),
                 bedrooms=bedrooms,
                 bathrooms=bathrooms,
-                timestamp=datetime.now(),
+                timestamp=now or datetime.now(),
                 source=self.name,
                 raw_data={
                     'price_text': price_text,
@@ -214,9 +258,25 @@ class ChototScraper(BaseScraper):
             return listing
             
         except Exception as e:
-            logger.error(f"Error parsing Chotot listing: {e}")
+            logger.error("Error parsing Chotot listing: %s", e)
             return None
     
+    @staticmethod
+    def _is_root_relative(href: str) -> bool:
+        """
+        Check whether an href can be appended to base_url as-is
+        
+        Root-relative paths without dot segments resolve to base_url + href,
+        which is much cheaper than a full urljoin.
+        
+        Args:
+            href: Relative href taken from the page
+        
+        Returns:
+            bool: True if base_url + href is the resolved URL
+        """
+        return href.startswith('/') and not href.startswith('//') and '/.' not in href
+    
     def parse_listing(self, listing_element: Any) -> Optional[PropertyListing]:
         """
         Parse a single listing element (synchronous version for compatibility)
@@ -233,43 +293,50 @@ class ChototScraper(BaseScraper):
 
 
 # Sample data for testing and development
-SAMPLE_CHOTOT_DATA = [
-    {
-        "title": "Căn hộ cao cấp tại Quận 2, TP.HCM",
-        "location": "Quận 2, TP.HCM",
-        "price": 3200000000,  # 3.2 billion VND
-        "area": 85.0,  # 85 m²
-        "price_per_m2": 37647058.82,
-        "image_url": "https://example.com/chotot-image1.jpg",
-        "link": "https://chotot.com/mua-ban-nha-dat/can-ho-cao-cap-quan-2",
-        "property_type": "Căn hộ",
-        "bedrooms": 3,
-        "bathrooms": 2,
-        "timestamp": datetime.now(),
-        "source": "Chotot",
-        "raw_data": {
-            "price_text": "3.2 tỷ",
-            "area_text": "85m²",
-            "property_type": "Căn hộ"
-        }
-    },
-    {
-        "title": "Nhà phố thương mại tại Quận 7, TP.HCM",
-        "location": "Quận 7, TP.HCM",
-        "price": 12000000000,  # 12 billion VND
-        "area": 200.0,  # 200 m²
-        "price_per_m2": 60000000.0,
-        "image_url": "https://example.com/chotot-image2.jpg",
-        "link": "https://chotot.com/mua-ban-nha-dat/nha-pho-thuong-mai-quan-7",
-        "property_type": "Nhà phố",
-        "bedrooms": 5,
-        "bathrooms": 4,
-        "timestamp": datetime.now(),
-        "source": "Chotot",
-        "raw_data": {
-            "price_text": "12 tỷ",
-            "area_text": "200m²",
-            "property_type": "Nhà phố"
+def get_sample_chotot_data() -> List[Dict[str, Any]]:
+    """
+    Build sample Chotot listings for testing and development
+    
+    Returns:
+        List[Dict[str, Any]]: Sample listing data timestamped at call time
+    """
+    return [
+        {
+            "title": "Căn hộ cao cấp tại Quận 2, TP.HCM",
+            "location": "Quận 2, TP.HCM",
+            "price": 3200000000,  # 3.2 billion VND
+            "area": 85.0,  # 85 m²
+            "price_per_m2": 37647058.82,
+            "image_url": "https://example.com/chotot-image1.jpg",
+            "link": "https://chotot.com/mua-ban-nha-dat/can-ho-cao-cap-quan-2",
+            "property_type": "Căn hộ",
+            "bedrooms": 3,
+            "bathrooms": 2,
+            "timestamp": datetime.now(),
+            "source": "Chotot",
+            "raw_data": {
+                "price_text": "3.2 tỷ",
+                "area_text": "85m²",
+                "property_type": "Căn hộ"
+            }
+        },
+        {
+            "title": "Nhà phố thương mại tại Quận 7, TP.HCM",
+            "location": "Quận 7, TP.HCM",
+            "price": 12000000000,  # 12 billion VND
+            "area": 200.0,  # 200 m²
+            "price_per_m2": 60000000.0,
+            "image_url": "https://example.com/chotot-image2.jpg",
+            "link": "https://chotot.com/mua-ban-nha-dat/nha-pho-thuong-mai-quan-7",
+            "property_type": "Nhà phố",
+            "bedrooms": 5,
+            "bathrooms": 4,
+            "timestamp": datetime.now(),
+            "source": "Chotot",
+            "raw_data": {
+                "price_text": "12 tỷ",
+                "area_text": "200m²",
+                "property_type": "Nhà phố"
+            }
         }
-    }
-] 
\ No newline at end of file
+    ]
@@ -255,17 +255,17 @@ async def run_sample_scraping():
     sample_listings = []
     
     # Add sample data from BatDongSan
-    from .batdongsan_scraper import SAMPLE_BATDONGSAN_DATA
+    from .batdongsan_scraper import get_sample_batdongsan_data
     from .base_scraper import PropertyListing
     
-    for data in SAMPLE_BATDONGSAN_DATA:
+    for data in get_sample_batdongsan_data():
         listing = PropertyListing(**data)
         sample_listings.append(listing)
     
     # Add sample data from Chotot
-    from .chotot_scraper import SAMPLE_CHOTOT_DATA
+    from .chotot_scraper import get_sample_chotot_data
     
-    for data in SAMPLE_CHOTOT_DATA:
+    for data in get_sample_chotot_data():
         listing = PropertyListing(**data)
         sample_listings.append(listing)
     
@@ -0,0 +1,48 @@
+"""
+Shared Test Fixtures
+
+This module provides the database fixtures and listing data used across the test modules.
+"""
+
+import pytest
+from datetime import datetime, timedelta
+
+import utils.auth as auth
+from database.database_manager import DatabaseManager
+from database.models import User
+
+
+def make_listing(location: str, price_per_m2: float, index: int, days_ago: float = 0) -> dict:
+    """Build listing data for insert_listing and insert_listings_batch"""
+    return {
+        'title': f"Listing {index}",
+        'location': location,
+        'price': price_per_m2 * 50,
+        'area': 50.0,
+        'price_per_m2': price_per_m2,
+        'link': f"https://example.com/listing/{index}",
+        'property_type': "Căn hộ",
+        'timestamp': datetime.utcnow() - timedelta(days=days_ago),
+        'source': "TestSource"
+    }
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """DatabaseManager on an empty SQLite file"""
+    return DatabaseManager(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+@pytest.fixture
+def user_id(db_manager):
+    """ID of a free-tier user saved in db_manager"""
+    with db_manager.get_session() as session:
+        user = User(
+            username="tester",
+            email="tester@example.com",
+            password=auth._hash_password("correct horse"),
+            name="Tester"
+        )
+        session.add(user)
+        session.commit()
+        return user.id
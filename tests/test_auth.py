@@ -0,0 +1,262 @@
+"""
+Tests for Authentication Module
+
+This module contains tests for user lookup and password handling in utils.auth.
+"""
+
+import pytest
+from flask import Flask, g
+from flask_jwt_extended import create_access_token, verify_jwt_in_request
+from werkzeug.security import generate_password_hash
+
+import utils.auth as auth
+from database.models import TierEnum
+
+
+@pytest.fixture
+def app(db_manager):
+    """Flask app sharing db_manager, without the sweeper"""
+    app = Flask(__name__)
+    app.extensions['db_manager'] = db_manager
+    return app
+
+
+@pytest.fixture
+def login_app(app):
+    """App able to issue access tokens"""
+    app.config['JWT_SECRET_KEY'] = "test-secret-key-for-signing-tokens"
+    auth.jwt.init_app(app)
+    return app
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    """Start every test with an empty user cache"""
+    auth._user_cache.clear()
+    yield
+    auth._user_cache.clear()
+
+
+class TestUserLookup:
+    """Test DatabaseManager user methods and the cached lookup"""
+    
+    def test_get_user_by_id(self, db_manager, user_id):
+        """Test loading a user by ID"""
+        user = db_manager.get_user_by_id(user_id)
+        
+        assert user.email == "tester@example.com"
+        assert db_manager.get_user_by_id(user_id + 1) is None
+    
+    def test_get_user_by_email_ignores_case(self, db_manager, user_id):
+        """Test that email lookups match whatever case the caller used"""
+        assert db_manager.get_user_by_email("Tester@Example.COM").id == user_id
+        assert db_manager.get_user_auth_tuple("TESTER@example.com").id == user_id
+    
+    def test_update_user(self, db_manager, user_id):
+        """Test saving changes to a detached user"""
+        user = db_manager.get_user_by_id(user_id)
+        user.subscription_tier = 'pro'
+        
+        assert db_manager.update_user(user)
+        assert db_manager.get_user_by_id(user_id).tier_id == TierEnum.PRO
+    
+    def test_cached_user_is_invalidated(self, db_manager, user_id):
+        """Test that a string JWT identity and an int ID share one cache entry"""
+        user = auth.get_cached_user(db_manager, str(user_id))
+        assert auth.get_cached_user(db_manager, user_id) is user
+        
+        user.subscription_tier = 'enterprise'
+        db_manager.update_user(user)
+        auth.invalidate_cached_user(user.id)
+        
+        reloaded = auth.get_cached_user(db_manager, str(user_id))
+        assert reloaded is not user
+        assert reloaded.tier_id == TierEnum.ENTERPRISE
+
+
+class TestTierChanges:
+    """Test tier upgrades and the tier_required decorator"""
+    
+    def upgrade(self, login_app, user_id, tier):
+        """Call upgrade_tier_handler as the given user"""
+        with login_app.app_context():
+            token = create_access_token(identity=str(user_id))
+        headers = {'Authorization': f"Bearer {token}"}
+        with login_app.test_request_context(method='POST', json={'tier': tier}, headers=headers):
+            verify_jwt_in_request()
+            return auth.upgrade_tier_handler()
+    
+    def test_failed_upgrade_leaves_cached_user(self, login_app, db_manager, user_id, monkeypatch):
+        """Test that a failed save returns 500 without touching the cached user"""
+        cached = auth.get_cached_user(db_manager, user_id)
+        monkeypatch.setattr(db_manager, 'update_user', lambda user: False)
+        
+        response = self.upgrade(login_app, user_id, 'pro')
+        
+        assert response.status_code == 500
+        assert cached.tier_id == TierEnum.FREE
+        assert auth.get_cached_user(db_manager, user_id) is cached
+    
+    def test_upgrade_invalidates_cached_user(self, login_app, db_manager, user_id):
+        """Test that a successful upgrade is saved and seen by the next lookup"""
+        cached = auth.get_cached_user(db_manager, user_id)
+        
+        response = self.upgrade(login_app, user_id, 'enterprise')
+        
+        assert response.status_code == 200
+        assert cached.tier_id == TierEnum.FREE
+        assert auth.get_cached_user(db_manager, user_id).tier_id == TierEnum.ENTERPRISE
+    
+    def test_tier_required_reads_current_tier(self, app, db_manager, user_id):
+        """Test that a tier changed by another process is honoured despite the cache"""
+        @auth.tier_required('pro')
+        def pro_only():
+            return 'pro'
+        
+        cached = auth.get_cached_user(db_manager, user_id)
+        upgraded = db_manager.get_user_by_id(user_id)
+        upgraded.subscription_tier = 'pro'
+        db_manager.update_user(upgraded)
+        
+        with app.test_request_context():
+            g.user = cached
+            assert pro_only() == 'pro'
+        
+        upgraded.subscription_tier = 'free'
+        db_manager.update_user(upgraded)
+        
+        with app.test_request_context():
+            g.user = cached
+            assert pro_only().status_code == 403
+
+
+class TestAuthRoutes:
+    """Test the /api/auth routes that need a token"""
+    
+    @pytest.fixture
+    def client(self, login_app):
+        """Test client for an app with the auth blueprint"""
+        from api.routes import auth_bp
+        login_app.register_blueprint(auth_bp, url_prefix='/api/auth')
+        return login_app.test_client()
+    
+    def test_missing_token_is_unauthorized(self, client):
+        """Test that profile and upgrade answer 401 instead of 500 without a token"""
+        assert client.get('/api/auth/profile').status_code == 401
+        assert client.post('/api/auth/upgrade', json={'tier': 'pro'}).status_code == 401
+    
+    def test_profile_with_token(self, client, login_app, user_id):
+        """Test that a valid token reaches the profile handler"""
+        with login_app.app_context():
+            token = create_access_token(identity=str(user_id))
+        
+        response = client.get('/api/auth/profile', headers={'Authorization': f"Bearer {token}"})
+        
+        assert response.status_code == 200
+
+
+class TestRegistration:
+    """Test register_handler input validation"""
+    
+    @pytest.mark.parametrize("email", ["tester@example.com\n", "tester@example", "tester @example.com"])
+    def test_invalid_email_is_rejected(self, app, email):
+        """Test that malformed emails, including a trailing newline, are refused"""
+        data = {'username': "newbie", 'email': email, 'password': "correct horse"}
+        with app.test_request_context(method='POST', json=data):
+            response = auth.register_handler()
+        
+        assert response.status_code == 400
+        assert response.get_json() == {'error': 'Invalid email format'}
+
+
+class TestLogin:
+    """Test AuthManager.login_user"""
+    
+    def test_legacy_hash_is_upgraded(self, login_app, db_manager, user_id):
+        """Test that a Werkzeug hash is replaced by bcrypt on a good login"""
+        db_manager.update_user_password(user_id, generate_password_hash("correct horse"))
+        auth_manager = auth.AuthManager(db_manager)
+        
+        with login_app.app_context():
+            assert auth_manager.login_user("tester@example.com", "wrong horse") is None
+            assert not auth._is_bcrypt_hash(db_manager.get_user_by_id(user_id).password)
+            
+            result = auth_manager.login_user("tester@example.com", "correct horse")
+            assert result['user']['id'] == user_id
+            
+            password_hash = db_manager.get_user_by_id(user_id).password
+            assert auth._is_bcrypt_hash(password_hash)
+            assert auth._verify_password(password_hash, "correct horse")
+            
+            # The upgraded hash keeps working
+            assert auth_manager.login_user("tester@example.com", "correct horse") is not None
+    
+    def test_login_ignores_email_case(self, login_app, db_manager, user_id):
+        """Test that a user can log in with a differently cased email"""
+        with login_app.app_context():
+            result = auth.AuthManager(db_manager).login_user("Tester@Example.com", "correct horse")
+        
+        assert result['user']['id'] == user_id
+    
+    def test_unknown_email(self, login_app, db_manager, user_id):
+        """Test that an unknown email fails like a wrong password"""
+        with login_app.app_context():
+            assert auth.AuthManager(db_manager).login_user("nobody@example.com", "correct horse") is None
+
+
+class TestRateLimiting:
+    """Test the Redis usage limiter and the limit_usage decorator"""
+    
+    def test_unreachable_redis_backs_off(self, app, monkeypatch):
+        """Test that a Redis failure fails open and is retried with backoff"""
+        monkeypatch.setenv('REDIS_URL', 'redis://127.0.0.1:1/0')
+        
+        with app.app_context():
+            assert auth.get_rate_limiter() is None
+            assert 'rate_limiter' not in app.extensions
+            retry_at, delay = app.extensions['rate_limiter_retry']
+            assert delay == auth.RATE_LIMITER_RETRY_MIN
+            
+            # Within the backoff no connection is attempted
+            assert auth.get_rate_limiter() is None
+            assert app.extensions['rate_limiter_retry'] == (retry_at, delay)
+            
+            app.extensions['rate_limiter_retry'] = (0.0, delay)
+            assert auth.get_rate_limiter() is None
+            assert app.extensions['rate_limiter_retry'][1] == 2 * delay
+    
+    def test_static_limits_skip_rate_limiter(self, app, db_manager, user_id, monkeypatch):
+        """Test that only per-window limit types are counted in Redis"""
+        metered = []
+        
+        class RecordingLimiter:
+            def allow(self, user_id, limit_type, limit):
+                metered.append(limit_type)
+                return True
+        
+        monkeypatch.setattr(auth, 'get_rate_limiter', RecordingLimiter)
+        
+        @auth.limit_usage('listings_per_request')
+        def listings():
+            return 'listings'
+        
+        @auth.limit_usage('api_calls_per_day')
+        def api_call():
+            return 'api_call'
+        
+        with app.test_request_context():
+            g.user = db_manager.get_user_by_id(user_id)
+            assert listings() == 'listings'
+            assert api_call() == 'api_call'
+        
+        assert metered == ['api_calls_per_day']
+
+
+class TestSubscriptionSweeper:
+    """Test the lock that elects the sweeper process"""
+    
+    def test_unopenable_lock_skips_sweeper(self, tmp_path, monkeypatch):
+        """Test that a lock file that cannot be opened disables the sweeper instead of failing"""
+        monkeypatch.setattr(auth, 'SUBSCRIPTION_SWEEP_LOCK', str(tmp_path / "missing" / "sweep.lock"))
+        
+        assert auth._acquire_sweeper_lock() is None
@@ -0,0 +1,139 @@
+"""
+Tests for Database Modules
+
+This module contains tests for the database manager and migrations.
+"""
+
+import json
+import math
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+from database.database_manager import DatabaseManager
+from database.migrations import MigrationManager
+from database.models import LocationStats, User
+from tests.conftest import make_listing
+
+
+def get_location_stats(db_manager: DatabaseManager) -> dict:
+    """Read location_stats keyed by location"""
+    with db_manager.get_session() as session:
+        return {row.location: row for row in session.query(LocationStats).all()}
+
+
+def get_migration(migration_manager: MigrationManager, version: int) -> dict:
+    """Find a migration by version"""
+    return next(m for m in migration_manager.migrations if m['version'] == version)
+
+
+class TestDatabase:
+    """Test DatabaseManager operations"""
+    
+    def test_batch_insert_refreshes_touched_locations(self, db_manager):
+        """Test that location_stats follows batch inserts"""
+        db_manager.insert_listings_batch([
+            make_listing("Quận 1", 40e6, 1),
+            make_listing("Quận 1", 60e6, 2),
+            make_listing("Quận 2", 30e6, 3)
+        ])
+        
+        stats = get_location_stats(db_manager)
+        assert stats["Quận 1"].n == 2
+        assert stats["Quận 1"].avg_price == pytest.approx(50e6)
+        assert stats["Quận 1"].std_price == pytest.approx(math.sqrt(2) * 10e6)
+        assert stats["Quận 2"].n == 1
+        assert stats["Quận 2"].std_price is None
+        
+        # Only Quận 2 is touched; Quận 1 keeps its row
+        quan_1_updated = stats["Quận 1"].updated_at
+        db_manager.insert_listings_batch([make_listing("Quận 2", 50e6, 4)])
+        
+        stats = get_location_stats(db_manager)
+        assert stats["Quận 1"].updated_at == quan_1_updated
+        assert stats["Quận 2"].n == 2
+        assert stats["Quận 2"].avg_price == pytest.approx(40e6)
+    
+    def test_refresh_reconciles_changed_listings(self, db_manager):
+        """Test that refresh_location_stats corrects sums after listings are deleted"""
+        db_manager.insert_listings_batch([
+            make_listing("Quận 1", 40e6, 1),
+            make_listing("Quận 1", 60e6, 2),
+            make_listing("Quận 1", 80e6, 3),
+            make_listing("Quận 2", 30e6, 4)
+        ])
+        with db_manager.get_session() as session:
+            session.execute(text("DELETE FROM property_listings WHERE link LIKE '%/3' OR link LIKE '%/4'"))
+            session.commit()
+        
+        assert db_manager.refresh_location_stats() == 1
+        
+        stats = get_location_stats(db_manager)
+        assert set(stats) == {"Quận 1"}
+        assert stats["Quận 1"].n == 2
+        assert stats["Quận 1"].avg_price == pytest.approx(50e6)
+        assert stats["Quận 1"].std_price == pytest.approx(math.sqrt(2) * 10e6)
+    
+    def test_single_insert_refreshes_location(self, db_manager):
+        """Test that insert_listing updates its location's statistics"""
+        db_manager.insert_listing(make_listing("Quận 3", 45e6, 1))
+        
+        assert get_location_stats(db_manager)["Quận 3"].n == 1
+
+
+class TestMigrations:
+    """Test MigrationManager data migrations"""
+    
+    def test_location_stats_migration_seeds_table(self, db_manager):
+        """Test that migration 11 fills location_stats from existing listings"""
+        db_manager.insert_listings_batch([
+            make_listing("Quận 1", 40e6, 1),
+            make_listing("Quận 1", 60e6, 2)
+        ])
+        with db_manager.get_session() as session:
+            session.execute(text("DROP TABLE location_stats"))
+            session.commit()
+        
+        migration_manager = MigrationManager(db_manager)
+        migration_manager.get_applied_migrations()
+        assert migration_manager.apply_migration(get_migration(migration_manager, 11))
+        
+        stats = get_location_stats(db_manager)
+        assert stats["Quận 1"].n == 2
+        assert stats["Quận 1"].avg_price == pytest.approx(50e6)
+    
+    def test_raw_data_migration_converts_python_repr(self, db_manager):
+        """Test that migration 9 rewrites dict reprs as JSON and keeps JSON rows"""
+        db_manager.insert_listings_batch([make_listing("Quận 1", 40e6, i) for i in range(3)])
+        legacy = {'rooms': 2, 'note': "Căn hộ 'đẹp'", 'is_deal': True, 'deal_score': 1.5, 'avg_price_location': 45e6}
+        stored = [str(legacy), json.dumps({'rooms': 3, 'is_deal': False}), "{'rooms': 4,"]
+        with db_manager.get_session() as session:
+            listing_ids = [row[0] for row in session.execute(text("SELECT id FROM property_listings ORDER BY id"))]
+            session.execute(
+                text("UPDATE property_listings SET raw_data = :raw_data WHERE id = :id"),
+                [{'id': listing_id, 'raw_data': raw_data} for listing_id, raw_data in zip(listing_ids, stored)]
+            )
+            session.commit()
+        
+        migration_manager = MigrationManager(db_manager)
+        migration_manager.get_applied_migrations()
+        assert migration_manager.apply_migration(get_migration(migration_manager, 9))
+        
+        with db_manager.get_session() as session:
+            raw_data = [row[0] for row in session.execute(text("SELECT raw_data FROM property_listings ORDER BY id"))]
+        
+        # Old deal keys are dropped from converted rows only
+        assert json.loads(raw_data[0]) == {'rooms': 2, 'note': "Căn hộ 'đẹp'"}
+        assert raw_data[1] == stored[1]
+        assert raw_data[2] == stored[2]
+    
+    def test_email_index_rejects_case_variants(self, db_manager, user_id):
+        """Test that migration 6 keeps emails unique regardless of case"""
+        migration_manager = MigrationManager(db_manager)
+        migration_manager.get_applied_migrations()
+        assert migration_manager.apply_migration(get_migration(migration_manager, 6))
+        
+        with db_manager.get_session() as session:
+            session.add(User(username="other", email="Tester@Example.com", password="x", name="Other"))
+            with pytest.raises(IntegrityError):
+                session.commit()
@@ -0,0 +1,117 @@
+"""
+Tests for Payment Integration
+
+This module contains tests for the Stripe subscription handling in utils.payments.
+"""
+
+import time
+import pytest
+from types import SimpleNamespace
+
+import utils.payments as payments
+from database.models import TierEnum
+from utils.payments import PaymentManager
+
+
+class FakeCheckoutSessions:
+    """Stand-in for stripe.checkout.Session that tracks session status"""
+    
+    def __init__(self):
+        self.created = []
+        self.status = {}
+    
+    def create(self, **kwargs):
+        session_id = f"cs_{len(self.created)}"
+        self.created.append(session_id)
+        self.status[session_id] = 'open'
+        return SimpleNamespace(id=session_id, url=f"https://checkout.stripe.com/{session_id}")
+    
+    def retrieve(self, session_id):
+        return SimpleNamespace(status=self.status[session_id], expires_at=time.time() + 3600)
+
+
+@pytest.fixture(autouse=True)
+def clear_checkout_cache():
+    """Start every test with no cached checkout sessions"""
+    payments._checkout_cache.clear()
+    yield
+    payments._checkout_cache.clear()
+
+
+class TestCheckoutSessions:
+    """Test reuse of cached checkout sessions"""
+    
+    def test_completed_session_is_not_reused(self, db_manager, user_id):
+        """Test that a session finished elsewhere is replaced by a new one"""
+        sessions = FakeCheckoutSessions()
+        payment_manager = PaymentManager(db_manager)
+        payment_manager.stripe = SimpleNamespace(
+            checkout=SimpleNamespace(Session=sessions),
+            error=SimpleNamespace(StripeError=Exception)
+        )
+        
+        first = payment_manager.create_checkout_session(user_id, 'pro')
+        assert payment_manager.create_checkout_session(user_id, 'pro') == first
+        assert sessions.created == ['cs_0']
+        
+        # Paid through a worker whose cache this process never sees
+        sessions.status['cs_0'] = 'complete'
+        
+        second = payment_manager.create_checkout_session(user_id, 'pro')
+        assert second['session_id'] == 'cs_1'
+        assert sessions.created == ['cs_0', 'cs_1']
+
+
+class TestSubscriptions:
+    """Test checkout completion and cancellation"""
+    
+    def test_checkout_stores_stripe_ids_for_cancellation(self, db_manager, user_id):
+        """Test that the IDs saved at checkout are used to cancel"""
+        payment_manager = PaymentManager(db_manager)
+        result = payment_manager._handle_checkout_completed({
+            'metadata': {'user_id': str(user_id), 'tier': 'pro'},
+            'customer': 'cus_123',
+            'subscription': 'sub_456'
+        })
+        
+        assert result == {'status': 'success', 'user_id': user_id, 'tier': 'pro'}
+        user = db_manager.get_user_by_id(user_id)
+        assert user.tier_id == TierEnum.PRO
+        assert user.stripe_customer_id == 'cus_123'
+        assert user.subscription_id == 'sub_456'
+        
+        modified = []
+        payment_manager.stripe = SimpleNamespace(Subscription=SimpleNamespace(
+            modify=lambda subscription_id, **kwargs: modified.append((subscription_id, kwargs))
+        ))
+        
+        result = payment_manager.cancel_subscription(user_id)
+        
+        assert result == {'message': 'Subscription cancelled successfully'}
+        assert modified == [('sub_456', {'cancel_at_period_end': True})]
+    
+    def test_failed_checkout_webhook_is_retried(self, db_manager, user_id, monkeypatch):
+        """Test that a checkout event that fails to apply is not acknowledged"""
+        payment_manager = PaymentManager(db_manager)
+        event = {
+            'type': 'checkout.session.completed',
+            'data': {'object': {'metadata': {'user_id': str(user_id), 'tier': 'pro'}}}
+        }
+        payment_manager.stripe = SimpleNamespace(Webhook=SimpleNamespace(
+            construct_event=lambda payload, sig_header, secret: event
+        ))
+        
+        def fail_update(user):
+            raise RuntimeError("database unavailable")
+        
+        monkeypatch.setattr(db_manager, 'update_user', fail_update)
+        
+        # A non-2xx status makes Stripe deliver the event again
+        assert payment_manager.handle_webhook(b"{}", "t=1,v1=sig") == ({'error': 'Failed to process checkout'}, 500)
+        assert db_manager.get_user_by_id(user_id).tier_id == TierEnum.FREE
+    
+    def test_cancel_without_subscription(self, db_manager, user_id):
+        """Test cancelling for a user who never checked out"""
+        result = PaymentManager(db_manager).cancel_subscription(user_id)
+        
+        assert result == ({'error': 'No active subscription found'}, 404)
@@ -0,0 +1,152 @@
+"""
+Tests for Trend Analysis
+
+This module contains tests for the price trend analysis in utils.trends.
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import textwrap
+import numpy as np
+import pytest
+from scipy import stats
+
+import utils.trends as trends
+from tests.conftest import make_listing
+from utils.trends import PriceTrendAnalyzer
+
+
+def make_groups(sizes: list, seed: int = 42) -> tuple:
+    """Build a fixed, location-sorted dataset of noisy linear price series"""
+    rng = np.random.default_rng(seed)
+    days, y = [], []
+    for i, size in enumerate(sizes):
+        x = np.sort(rng.integers(0, 30, size)).astype(np.float32)
+        days.append(x)
+        y.append((40e6 + 1e6 * i + 2e5 * x + rng.normal(0, 2e6, size)).astype(np.float32))
+    starts = np.cumsum([0] + sizes[:-1]).astype(np.int64)
+    return np.concatenate(days), np.concatenate(y), starts
+
+
+# Calls the moments kernel from several threads at once
+CONCURRENT_KERNEL_SCRIPT = textwrap.dedent("""
+    import threading
+    import numpy as np
+    import utils.trends as trends
+    
+    days = np.arange(100_000, dtype=np.float32) % 30
+    y = np.full(100_000, 50e6, dtype=np.float32)
+    starts = np.arange(0, 100_000, 100, dtype=np.int64)
+    
+    def fit():
+        for _ in range(20):
+            trends._group_moments(days, y, starts)
+    
+    threads = [threading.Thread(target=fit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+""")
+
+
+MOMENT_KERNELS = [trends._group_moments_numpy]
+if trends.numba is not None:
+    MOMENT_KERNELS.append(trends._group_moments_numba)
+
+
+class TestCalculatePriceTrends:
+    """Test PriceTrendAnalyzer.calculate_price_trends"""
+    
+    def test_empty_database(self, db_manager, caplog):
+        """Test that an empty window returns no trends without an error"""
+        with caplog.at_level(logging.WARNING, logger='utils.trends'):
+            result = PriceTrendAnalyzer(db_manager).calculate_price_trends()
+        
+        assert result == {}
+        assert "No data found for trend analysis" in caplog.text
+        assert not [r for r in caplog.records if r.levelno >= logging.ERROR]
+    
+    def test_chunk_boundary_splits_location(self, db_manager, monkeypatch):
+        """Test that a location split across read chunks is fitted as one group"""
+        listings = []
+        for i in range(12):
+            listings.append(make_listing("Quận 1", 50e6 + 1e5 * i, i, days_ago=24 - 2 * i))
+        for i in range(5):
+            listings.append(make_listing("Quận 2", 40e6 - 2e5 * i, 100 + i, days_ago=20 - 4 * i))
+        db_manager.insert_listings_batch(listings)
+        
+        expected = PriceTrendAnalyzer(db_manager).calculate_price_trends()
+        
+        # 5 rows per chunk puts boundaries inside both locations
+        monkeypatch.setattr(trends, 'READ_CHUNK_SIZE', 5)
+        chunked = PriceTrendAnalyzer(db_manager).calculate_price_trends()
+        
+        assert set(chunked) == {"Quận 1", "Quận 2"}
+        assert chunked["Quận 1"]['data_points'] == 12
+        assert chunked["Quận 2"]['data_points'] == 5
+        for location, trend in expected.items():
+            for key, value in trend.items():
+                assert chunked[location][key] == pytest.approx(value, nan_ok=True)
+
+
+class TestFitGroupTrends:
+    """Test the vectorised per-location fits in _fit_group_trends"""
+    
+    @pytest.mark.parametrize('kernel', MOMENT_KERNELS, ids=lambda kernel: kernel.__name__)
+    def test_ols_matches_statsmodels(self, kernel, monkeypatch):
+        """Test closed-form OLS against one statsmodels fit per group"""
+        sm = pytest.importorskip('statsmodels.api')
+        monkeypatch.setattr(trends, '_group_moments', kernel)
+        
+        sizes = [60, 80, 120]
+        days, y, starts = make_groups(sizes)
+        fit = trends._fit_group_trends(days, y, starts)
+        
+        for g, (start, size) in enumerate(zip(starts, sizes)):
+            x_g = days[start:start + size].astype(np.float64)
+            y_g = y[start:start + size].astype(np.float64)
+            model = sm.OLS(y_g, sm.add_constant(x_g)).fit()
+            
+            assert fit['n'][g] == size
+            assert fit['intercept'][g] == pytest.approx(model.params[0], rel=1e-5)
+            assert fit['slope'][g] == pytest.approx(model.params[1], rel=1e-4)
+            assert fit['p_value'][g] == pytest.approx(model.pvalues[1], rel=1e-3, abs=1e-12)
+            assert fit['r_squared'][g] == pytest.approx(model.rsquared, rel=1e-4)
+            assert fit['mean'][g] == pytest.approx(y_g.mean(), rel=1e-6)
+            assert fit['std'][g] == pytest.approx(y_g.std(ddof=1), rel=1e-4)
+    
+    def test_theil_sen_resists_outlier(self):
+        """Test that a small group with one outlier is fitted with Theil-Sen"""
+        days = np.arange(12, dtype=np.float32)
+        y = (50e6 + 1e5 * days).astype(np.float32)
+        y[7] = 500e6  # mistyped price
+        
+        fit = trends._fit_group_trends(days, y, np.array([0], dtype=np.int64))
+        expected = stats.theilslopes(y.astype(np.float64), days.astype(np.float64))
+        
+        assert fit['n'][0] == 12
+        assert fit['slope'][0] == pytest.approx(1e5, rel=1e-3)
+        assert fit['slope'][0] == pytest.approx(expected.slope, rel=1e-6)
+        assert fit['intercept'][0] == pytest.approx(expected.intercept, rel=1e-6)
+        assert 0.0 <= fit['p_value'][0] < 0.05
+        
+        # Least squares on the same points is pulled far off the line
+        assert np.polyfit(days, y, 1)[0] > 10 * fit['slope'][0]
+    
+    @pytest.mark.skipif(trends.numba is None, reason="numba is not installed")
+    def test_concurrent_calls_with_workqueue_layer(self):
+        """Test that threads sharing the kernel do not abort numba's workqueue layer"""
+        # The threading layer is fixed at numba's first parallel call, so
+        # the check needs a fresh interpreter
+        repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        python_path = os.pathsep.join(filter(None, [repo_root, os.environ.get('PYTHONPATH')]))
+        env = dict(os.environ, NUMBA_THREADING_LAYER='workqueue', PYTHONPATH=python_path)
+        result = subprocess.run(
+            [sys.executable, '-c', CONCURRENT_KERNEL_SCRIPT],
+            env=env, capture_output=True, text=True, timeout=300
+        )
+        
+        assert result.returncode == 0, result.stderr
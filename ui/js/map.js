@@ -194,9 +194,7 @@ class PropertyMap {
         
         // Calculate average price for this location
         const avgPrice = listings.reduce((sum, listing) => sum + listing.price_per_m2, 0) / listings.length;
-        const deals = listings.filter(listing => 
-            listing.raw_data && listing.raw_data.is_deal
-        );
+        const deals = listings.filter(listing => listing.is_deal);
         
         // Create marker with custom icon
         const marker = L.marker(coords, {
@@ -254,7 +252,7 @@ class PropertyMap {
     }
     
     createPopupContent(location, listings, avgPrice) {
-        const deals = listings.filter(l => l.raw_data && l.raw_data.is_deal);
+        const deals = listings.filter(l => l.is_deal);
         
         let content = `
             <div class="map-popup">
@@ -275,7 +273,7 @@ class PropertyMap {
         
         // Show first 3 listings
         listings.slice(0, 3).forEach(listing => {
-            const dealBadge = listing.raw_data && listing.raw_data.is_deal ? 
+            const dealBadge = listing.is_deal ? 
                 '<span style="color: #ff4444; font-weight: bold;">DEAL</span> ' : '';
             
             content += `
@@ -0,0 +1,37 @@
+"""
+Trend Kernel Build
+
+This module compiles the per-location moments kernel from utils.trends
+ahead of time with numba.pycc, so short-lived processes (cron jobs, fresh
+API workers) call native code without waiting for the JIT.
+
+Build the extension (utils/trend_kernel*.so) with:
+
+    python -m utils._trend_kernel
+
+The build is a snapshot: rebuild it whenever _group_moments_numba changes,
+or the old code keeps running.
+
+utils.trends uses the built module when it can import it and falls back to
+the JIT kernel, then to NumPy, otherwise. The AOT kernel runs the groups in
+order; the JIT kernel runs them in parallel.
+"""
+
+import os
+from numba.pycc import CC
+
+from utils.trends import _group_moments_numba
+
+cc = CC('trend_kernel')
+cc.output_dir = os.path.dirname(os.path.abspath(__file__))
+
+# float32 day offsets and prices as read by PriceTrendAnalyzer, int64 group
+# offsets as produced by np.flatnonzero
+cc.export(
+    'group_moments',
+    'Tuple((i8[:], f8[:], f8[:], f8[:], f8[:], f8[:]))(f4[:], f4[:], i8[:])'
+)(_group_moments_numba.py_func)
+
+
+if __name__ == '__main__':
+    cc.compile()
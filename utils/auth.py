@@ -5,45 +5,163 @@ This module provides JWT-based authentication for the real estate scraper.
 """
 
 import os
+import re
+import hashlib
 import logging
+import tempfile
+import threading
+import time
+import uuid
 from datetime import datetime, timedelta
-from functools import wraps
-from flask import request, jsonify, current_app
+from functools import lru_cache, wraps
+from types import MappingProxyType
+import bcrypt
+import orjson
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from cachetools import TTLCache
+from flask import request, current_app, g
 from flask_jwt_extended import (
     JWTManager, jwt_required, create_access_token, 
     get_jwt_identity, verify_jwt_in_request
 )
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import check_password_hash
 from sqlalchemy.orm import Session
-from database.models import User, PropertyListing, Base
+from database.models import User, PropertyListing, Base, TierEnum, TIER_IDS, TIER_NAMES
 from database.database_manager import DatabaseManager
 
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 logger = logging.getLogger(__name__)
 
 # Initialize JWT manager
 jwt = JWTManager()
 
-# Tier limits
-TIER_LIMITS = {
-    'free': {
+# Short-lived cache of resolved users so authenticated requests skip the DB
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '60'))
+_user_cache = TTLCache(maxsize=5000, ttl=USER_CACHE_TTL)
+_user_cache_lock = threading.Lock()
+
+# bcrypt work factor; raise it as hardware gets faster (each step doubles the cost)
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+
+# Tier limits, indexed by User.tier_id; read-only so callers never need a copy
+TIER_LIMITS = (
+    # TierEnum.FREE
+    MappingProxyType({
         'listings_per_request': 10,
         'alerts_limit': 3,
         'export_limit': 100,
         'api_calls_per_day': 100
-    },
-    'pro': {
+    }),
+    # TierEnum.PRO
+    MappingProxyType({
         'listings_per_request': 100,
         'alerts_limit': 10,
         'export_limit': 1000,
         'api_calls_per_day': 1000
-    },
-    'enterprise': {
+    }),
+    # TierEnum.ENTERPRISE
+    MappingProxyType({
         'listings_per_request': 10000,
         'alerts_limit': 50,
         'export_limit': 10000,
         'api_calls_per_day': 10000
-    }
-}
+    })
+)
+
+# Registration input rules, checked before any password hashing. Use
+# EMAIL_RE.fullmatch: a $ anchor would also accept a trailing newline
+EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+MIN_PASSWORD_LENGTH = 8
+
+# Rolling window for usage limits, in seconds
+RATE_LIMIT_WINDOW = 86400
+
+# TIER_LIMITS keys that are per-window usage counts; the rest are static caps
+RATE_LIMIT_TYPES = frozenset({'api_calls_per_day'})
+
+# Backoff between attempts to reach Redis after a failure, in seconds
+RATE_LIMITER_RETRY_MIN = 5
+RATE_LIMITER_RETRY_MAX = 300
+
+# How often lapsed subscriptions are downgraded, in seconds
+SUBSCRIPTION_SWEEP_INTERVAL = int(os.getenv('SUBSCRIPTION_SWEEP_INTERVAL', '60'))
+
+# Held by the one process per host that runs the sweeper
+SUBSCRIPTION_SWEEP_LOCK = os.getenv(
+    'SUBSCRIPTION_SWEEP_LOCK',
+    os.path.join(tempfile.gettempdir(), 'real-estate-subscription-sweep.lock')
+)
+
+
+def _prehash_password(password: str) -> bytes:
+    """
+    Reduce a password to a fixed-length ASCII digest before bcrypt
+    
+    bcrypt silently truncates input at 72 bytes and stops at NUL bytes,
+    so long or unusual passwords are hashed with SHA-256 first.
+    """
+    return hashlib.sha256(password.encode('utf-8')).hexdigest().encode('ascii')
+
+
+def _hash_password(password: str) -> str:
+    """Hash a password with bcrypt"""
+    return bcrypt.hashpw(_prehash_password(password), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('ascii')
+
+
+@lru_cache(maxsize=None)
+def _dummy_password_hash() -> str:
+    """bcrypt hash checked against when the login email is unknown"""
+    return _hash_password(os.urandom(16).hex())
+
+
+def _is_bcrypt_hash(password_hash: str) -> bool:
+    """Check whether a stored hash was produced by bcrypt"""
+    return password_hash.startswith('$2')
+
+
+def _verify_password(password_hash: str, password: str) -> bool:
+    """Verify a password against a bcrypt or legacy Werkzeug hash"""
+    if _is_bcrypt_hash(password_hash):
+        return bcrypt.checkpw(_prehash_password(password), password_hash.encode('ascii'))
+    return check_password_hash(password_hash, password)
+
+
+def _json_dumps(payload) -> bytes:
+    """Serialize a payload to JSON bytes"""
+    return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def ojsonify(payload, status: int = 200):
+    """
+    Build a JSON response, serialized with orjson
+    
+    datetimes and NumPy values can be passed as-is; datetimes are written
+    in ISO 8601.
+    
+    Args:
+        payload: JSON-serializable data
+        status: HTTP status code
+        
+    Returns:
+        Response: Flask response with an application/json body
+    """
+    return current_app.response_class(_json_dumps(payload), status=status, mimetype='application/json')
+
+
+# Fixed JWT error responses, serialized once at import
+_EXPIRED = (_json_dumps({'error': 'Token has expired'}), 401)
+_INVALID = (_json_dumps({'error': 'Invalid token'}), 401)
+_MISSING = (_json_dumps({'error': 'Missing token'}), 401)
 
 
 class AuthManager:
@@ -58,7 +176,7 @@ class AuthManager:
         
         Args:
             username: Username
-            email: Email address
+            email: Email address, stored lowercased
             password: Plain text password
             tier: Subscription tier (free, pro, enterprise)
             
@@ -66,6 +184,10 @@ class AuthManager:
             User object or None if failed
         """
         try:
+            # Emails are stored lowercased, so login and the unique
+            # lower(email) index agree on what counts as the same address
+            email = email.lower()
+            
             # Check if user already exists
             existing_user = self.db_manager.get_user_by_email(email)
             if existing_user:
@@ -73,14 +195,14 @@ class AuthManager:
                 return None
             
             # Hash password
-            hashed_password = generate_password_hash(password)
+            hashed_password = _hash_password(password)
             
             # Create user
             user_data = {
                 'username': username,
                 'email': email,
                 'password': hashed_password,
-                'subscription_tier': tier,
+                'tier_id': TIER_IDS.get(tier, TierEnum.FREE),
                 'is_active': True
             }
             
@@ -109,8 +231,13 @@ class AuthManager:
             dict with token and user info, or None if failed
         """
         try:
-            # Get user by email
-            user = self.db_manager.get_user_by_email(email)
+            # Get only the columns login needs
+            user = self.db_manager.get_user_auth_tuple(email)
+            
+            # Always run one hash check so response time does not reveal
+            # whether the email is registered
+            password_hash = user.password if user else _dummy_password_hash()
+            password_ok = _verify_password(password_hash, password)
             
             if not user:
                 logger.warning(f"Login failed: user not found: {email}")
@@ -122,14 +249,13 @@ class AuthManager:
                 return None
             
             # Verify password
-            if not check_password_hash(user.password, password):
+            if not password_ok:
                 logger.warning(f"Login failed: invalid password for: {email}")
                 return None
             
-            # Check subscription expiration
-            if user.subscription_expires and user.subscription_expires < datetime.utcnow():
-                logger.warning(f"Login failed: subscription expired for: {email}")
-                return None
+            # Upgrade legacy Werkzeug hashes now that we have the plain password
+            if not _is_bcrypt_hash(user.password):
+                self.db_manager.update_user_password(user.id, _hash_password(password))
             
             # Create access token
             token = create_access_token(
@@ -146,7 +272,7 @@ class AuthManager:
                     'username': user.username,
                     'email': user.email,
                     'tier': user.subscription_tier,
-                    'subscription_expires': user.subscription_expires.isoformat() if user.subscription_expires else None
+                    'subscription_expires': user.subscription_expires
                 }
             }
             
@@ -156,14 +282,10 @@ class AuthManager:
     
     def get_current_user(self):
         """Get current authenticated user"""
-        try:
-            user_id = get_jwt_identity()
-            if user_id:
-                return self.db_manager.get_user_by_id(user_id)
-            return None
-        except Exception as e:
-            logger.error(f"Error getting current user: {e}")
-            return None
+        user_id = get_jwt_identity()
+        if user_id:
+            return get_cached_user(self.db_manager, user_id)
+        return None
     
     def check_tier_limit(self, user, limit_type: str, current_usage: int = 0):
         """
@@ -177,77 +299,256 @@ class AuthManager:
         Returns:
             bool: True if within limits, False if exceeded
         """
-        try:
-            tier = user.subscription_tier
-            if tier not in TIER_LIMITS:
-                tier = 'free'  # Default to free tier
-            
-            limit = TIER_LIMITS[tier].get(limit_type, 0)
-            return current_usage < limit
-            
-        except Exception as e:
-            logger.error(f"Error checking tier limit: {e}")
-            return False
+        return current_usage < TIER_LIMITS[user.tier_id].get(limit_type, 0)
     
     def get_user_limits(self, user):
-        """Get user's tier limits"""
-        try:
-            tier = user.subscription_tier
-            if tier not in TIER_LIMITS:
-                tier = 'free'
-            
-            return TIER_LIMITS[tier].copy()
+        """Get a read-only view of the user's tier limits"""
+        return TIER_LIMITS[user.tier_id]
+
+
+class RateLimiter:
+    """
+    Rolling-window usage limiter backed by Redis
+    
+    Each (user, limit type) pair is a sorted set of request timestamps.
+    A Lua script trims, counts and records in one atomic round trip.
+    """
+    
+    # KEYS[1] = key; ARGV = now, window, limit, unique member
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local window = tonumber(ARGV[2])
+    redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, now - window)
+    if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[3]) then
+        return 0
+    end
+    redis.call('ZADD', KEYS[1], now, ARGV[4])
+    redis.call('EXPIRE', KEYS[1], window)
+    return 1
+    """
+    
+    def __init__(self, client):
+        self.client = client
+        self.script_sha = client.script_load(self.SCRIPT)
+        # Keys denied within the last second are rejected without a round trip
+        self._denied = TTLCache(maxsize=10000, ttl=1)
+        self._denied_lock = threading.Lock()
+    
+    def allow(self, user_id, limit_type: str, limit: int, window: int = RATE_LIMIT_WINDOW) -> bool:
+        """
+        Record a use and check it against the limit
+        
+        Args:
+            user_id: User ID
+            limit_type: Type of limit being consumed
+            limit: Maximum uses allowed within the window
+            window: Window length in seconds
             
-        except Exception as e:
-            logger.error(f"Error getting user limits: {e}")
-            return TIER_LIMITS['free'].copy()
+        Returns:
+            bool: True if within limits, False if exceeded
+        """
+        key = f"rate:{user_id}:{limit_type}"
+        with self._denied_lock:
+            if key in self._denied:
+                return False
+        
+        args = (time.time(), window, limit, uuid.uuid4().hex)
+        try:
+            try:
+                allowed = self.client.evalsha(self.script_sha, 1, key, *args)
+            except redis.exceptions.NoScriptError:
+                # Script cache was flushed (e.g. Redis restarted)
+                self.script_sha = self.client.script_load(self.SCRIPT)
+                allowed = self.client.evalsha(self.script_sha, 1, key, *args)
+        except redis.RedisError as e:
+            # Fail open so a Redis outage does not lock every user out
+            logger.error(f"Rate limit check failed: {e}")
+            return True
+        
+        if not allowed:
+            with self._denied_lock:
+                self._denied[key] = True
+        return bool(allowed)
+
+
+def get_db_manager() -> DatabaseManager:
+    """Get the app-wide DatabaseManager, creating it on first use"""
+    extensions = current_app.extensions
+    if 'db_manager' not in extensions:
+        extensions['db_manager'] = DatabaseManager()
+    return extensions['db_manager']
+
+
+def get_auth_manager() -> AuthManager:
+    """Get the app-wide AuthManager, creating it on first use"""
+    extensions = current_app.extensions
+    if 'auth_manager' not in extensions:
+        extensions['auth_manager'] = AuthManager(get_db_manager())
+    return extensions['auth_manager']
+
+
+def get_rate_limiter():
+    """
+    Get the app-wide RateLimiter, creating it on first use
+    
+    When Redis cannot be reached, callers get None (fail open) and the
+    connection is retried with exponential backoff, so the limiter comes
+    back once Redis does.
+    
+    Returns:
+        RateLimiter, or None when REDIS_URL is unset or Redis is unavailable
+    """
+    extensions = current_app.extensions
+    if 'rate_limiter' in extensions:
+        return extensions['rate_limiter']
+    
+    redis_url = os.getenv('REDIS_URL')
+    if not redis_url or redis is None:
+        extensions['rate_limiter'] = None
+        return None
+    
+    retry_at, delay = extensions.get('rate_limiter_retry', (0.0, 0))
+    if time.monotonic() < retry_at:
+        return None
+    
+    try:
+        limiter = RateLimiter(redis.Redis.from_url(redis_url))
+    except redis.RedisError as e:
+        delay = min(max(delay * 2, RATE_LIMITER_RETRY_MIN), RATE_LIMITER_RETRY_MAX)
+        extensions['rate_limiter_retry'] = (time.monotonic() + delay, delay)
+        logger.error(f"Rate limiter unavailable, retrying in {delay}s: {e}")
+        return None
+    
+    extensions.pop('rate_limiter_retry', None)
+    extensions['rate_limiter'] = limiter
+    return limiter
+
+
+def get_cached_user(db_manager: DatabaseManager, user_id):
+    """
+    Get a user by ID, serving repeat lookups from a short TTL cache
+    
+    Args:
+        db_manager: Database manager used on a cache miss
+        user_id: User ID (JWT identities arrive as strings)
+        
+    Returns:
+        User object or None if not found
+    """
+    # Key by int so invalidate_cached_user(user.id) finds the entry
+    user_id = int(user_id)
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+    
+    user = db_manager.get_user_by_id(user_id)
+    if user:
+        with _user_cache_lock:
+            _user_cache[user_id] = user
+    return user
+
+
+def invalidate_cached_user(user_id):
+    """Drop a user from the cache after their record changes"""
+    with _user_cache_lock:
+        _user_cache.pop(int(user_id), None)
+
+
+def sweep_expired_subscriptions(db_manager: DatabaseManager):
+    """Downgrade lapsed subscriptions and drop those users from the cache"""
+    user_ids = db_manager.downgrade_expired_subscriptions()
+    for user_id in user_ids:
+        invalidate_cached_user(user_id)
+    
+    if user_ids:
+        logger.info(f"Downgraded {len(user_ids)} expired subscriptions")
+
+
+def _acquire_sweeper_lock():
+    """
+    Take the lock that lets a single process run the subscription sweeper
+    
+    Every gunicorn worker calls init_jwt; only the one that gets this lock
+    starts a scheduler. The OS drops the lock when that worker exits, and
+    the worker gunicorn starts in its place takes it over. The sweep is a
+    single idempotent UPDATE, so one sweeper per host is safe.
+    
+    Returns:
+        Open lock file to keep for the life of the process, or None if
+        another process already runs the sweeper or the lock file cannot
+        be opened
+    """
+    try:
+        lock_file = open(SUBSCRIPTION_SWEEP_LOCK, 'a')
+    except OSError as e:
+        logger.warning(f"Subscription sweeper disabled, cannot open {SUBSCRIPTION_SWEEP_LOCK}: {e}")
+        return None
+    
+    if fcntl is None:
+        # No flock on this platform; assume a single process
+        return lock_file
+    
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+    return lock_file
+
+
+def _current_user_cached():
+    """
+    Resolve the authenticated user once per request
+    
+    Stacked decorators share the result through flask.g, so the JWT is
+    verified and the user looked up only by the first one.
+    
+    Returns:
+        User object or None if not found
+    """
+    if 'user' in g:
+        return g.user
+    
+    verify_jwt_in_request()
+    g.user = get_cached_user(get_db_manager(), get_jwt_identity())
+    return g.user
 
 
 def auth_required(f):
     """Decorator to require authentication"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        try:
-            verify_jwt_in_request()
-            return f(*args, **kwargs)
-        except Exception as e:
-            logger.error(f"Authentication failed: {e}")
-            return jsonify({'error': 'Authentication required'}), 401
+        verify_jwt_in_request()
+        return f(*args, **kwargs)
     return decorated_function
 
 
 def tier_required(min_tier: str):
     """Decorator to require minimum subscription tier"""
+    min_tier_id = TIER_IDS.get(min_tier, TierEnum.FREE)
+    
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                verify_jwt_in_request()
-                user_id = get_jwt_identity()
-                
-                # Get user from database
-                db_manager = DatabaseManager()
-                user = db_manager.get_user_by_id(user_id)
-                
-                if not user:
-                    return jsonify({'error': 'User not found'}), 404
-                
-                # Check tier
-                tier_order = ['free', 'pro', 'enterprise']
-                user_tier_index = tier_order.index(user.subscription_tier) if user.subscription_tier in tier_order else 0
-                required_tier_index = tier_order.index(min_tier) if min_tier in tier_order else 0
-                
-                if user_tier_index < required_tier_index:
-                    return jsonify({
-                        'error': f'Subscription tier {min_tier} or higher required',
-                        'current_tier': user.subscription_tier
-                    }), 403
-                
-                return f(*args, **kwargs)
-                
-            except Exception as e:
-                logger.error(f"Tier check failed: {e}")
-                return jsonify({'error': 'Authentication required'}), 401
+            user = _current_user_cached()
+            
+            if not user:
+                return ojsonify({'error': 'User not found'}, 404)
+            
+            # Check tier against the database: another worker may have
+            # changed it since this process cached the user
+            tier_id = get_db_manager().get_user_tier_id(user.id)
+            if tier_id is None:
+                return ojsonify({'error': 'User not found'}, 404)
+            
+            if tier_id < min_tier_id:
+                return ojsonify({
+                    'error': f'Subscription tier {min_tier} or higher required',
+                    'current_tier': TIER_NAMES[tier_id]
+                }, 403)
+            
+            return f(*args, **kwargs)
         return decorated_function
     return decorator
 
@@ -257,32 +558,29 @@ def limit_usage(limit_type: str):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            try:
-                verify_jwt_in_request()
-                user_id = get_jwt_identity()
-                
-                # Get user from database
-                db_manager = DatabaseManager()
-                user = db_manager.get_user_by_id(user_id)
-                
-                if not user:
-                    return jsonify({'error': 'User not found'}), 404
-                
-                # Check limits (simplified - in production, track actual usage)
-                auth_manager = AuthManager(db_manager)
-                if not auth_manager.check_tier_limit(user, limit_type):
-                    limits = auth_manager.get_user_limits(user)
-                    return jsonify({
-                        'error': f'Usage limit exceeded for {limit_type}',
-                        'limit': limits.get(limit_type, 0),
-                        'tier': user.subscription_tier
-                    }), 429
-                
-                return f(*args, **kwargs)
-                
-            except Exception as e:
-                logger.error(f"Usage limit check failed: {e}")
-                return jsonify({'error': 'Authentication required'}), 401
+            user = _current_user_cached()
+            
+            if not user:
+                return ojsonify({'error': 'User not found'}, 404)
+            
+            # Only per-window counts go through Redis; static caps and
+            # requests made while Redis is unavailable use the tier limit
+            auth_manager = get_auth_manager()
+            limits = auth_manager.get_user_limits(user)
+            rate_limiter = get_rate_limiter() if limit_type in RATE_LIMIT_TYPES else None
+            if rate_limiter is not None:
+                allowed = rate_limiter.allow(user.id, limit_type, limits.get(limit_type, 0))
+            else:
+                allowed = auth_manager.check_tier_limit(user, limit_type)
+            
+            if not allowed:
+                return ojsonify({
+                    'error': f'Usage limit exceeded for {limit_type}',
+                    'limit': limits.get(limit_type, 0),
+                    'tier': user.subscription_tier
+                }, 429)
+            
+            return f(*args, **kwargs)
         return decorated_function
     return decorator
 
@@ -294,35 +592,35 @@ def register_handler():
         data = request.get_json()
         
         if not data:
-            return jsonify({'error': 'No data provided'}), 400
+            return ojsonify({'error': 'No data provided'}, 400)
         
         required_fields = ['username', 'email', 'password']
         for field in required_fields:
             if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+                return ojsonify({'error': f'Missing required field: {field}'}, 400)
         
-        # Validate email format
-        if '@' not in data['email']:
-            return jsonify({'error': 'Invalid email format'}), 400
+        # Validate input before register_user spends time on bcrypt
+        email = data['email']
+        if not isinstance(email, str) or not EMAIL_RE.fullmatch(email):
+            return ojsonify({'error': 'Invalid email format'}, 400)
         
         # Validate password strength
-        if len(data['password']) < 6:
-            return jsonify({'error': 'Password must be at least 6 characters'}), 400
+        password = data['password']
+        if not isinstance(password, str) or len(password) < MIN_PASSWORD_LENGTH:
+            return ojsonify({'error': f'Password must be at least {MIN_PASSWORD_LENGTH} characters'}, 400)
         
-        # Create auth manager
-        db_manager = DatabaseManager()
-        auth_manager = AuthManager(db_manager)
+        auth_manager = get_auth_manager()
         
         # Register user
         user = auth_manager.register_user(
             username=data['username'],
-            email=data['email'],
-            password=data['password'],
+            email=email,
+            password=password,
             tier=data.get('tier', 'free')
         )
         
         if user:
-            return jsonify({
+            return ojsonify({
                 'message': 'User registered successfully',
                 'user': {
                     'id': user.id,
@@ -330,13 +628,13 @@ def register_handler():
                     'email': user.email,
                     'tier': user.subscription_tier
                 }
-            }), 201
+            }, 201)
         else:
-            return jsonify({'error': 'Registration failed'}), 500
+            return ojsonify({'error': 'Registration failed'}, 500)
             
     except Exception as e:
         logger.error(f"Registration handler error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return ojsonify({'error': 'Internal server error'}, 500)
 
 
 def login_handler():
@@ -345,59 +643,55 @@ def login_handler():
         data = request.get_json()
         
         if not data:
-            return jsonify({'error': 'No data provided'}), 400
+            return ojsonify({'error': 'No data provided'}, 400)
         
         if 'email' not in data or 'password' not in data:
-            return jsonify({'error': 'Email and password required'}), 400
+            return ojsonify({'error': 'Email and password required'}, 400)
         
-        # Create auth manager
-        db_manager = DatabaseManager()
-        auth_manager = AuthManager(db_manager)
+        auth_manager = get_auth_manager()
         
         # Login user
         result = auth_manager.login_user(data['email'], data['password'])
         
         if result:
-            return jsonify(result), 200
+            return ojsonify(result, 200)
         else:
-            return jsonify({'error': 'Invalid credentials'}), 401
+            return ojsonify({'error': 'Invalid credentials'}, 401)
             
     except Exception as e:
         logger.error(f"Login handler error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return ojsonify({'error': 'Internal server error'}, 500)
 
 
 def profile_handler():
     """Get user profile"""
     try:
-        # Create auth manager
-        db_manager = DatabaseManager()
-        auth_manager = AuthManager(db_manager)
+        auth_manager = get_auth_manager()
         
         # Get current user
         user = auth_manager.get_current_user()
         
         if not user:
-            return jsonify({'error': 'User not found'}), 404
+            return ojsonify({'error': 'User not found'}, 404)
         
         # Get user limits
         limits = auth_manager.get_user_limits(user)
         
-        return jsonify({
+        return ojsonify({
             'user': {
                 'id': user.id,
                 'username': user.username,
                 'email': user.email,
                 'tier': user.subscription_tier,
-                'subscription_expires': user.subscription_expires.isoformat() if user.subscription_expires else None,
-                'created_at': user.created_at.isoformat() if user.created_at else None
+                'subscription_expires': user.subscription_expires,
+                'created_at': user.created_at
             },
-            'limits': limits
-        }), 200
+            'limits': dict(limits)
+        }, 200)
         
     except Exception as e:
         logger.error(f"Profile handler error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return ojsonify({'error': 'Internal server error'}, 500)
 
 
 def upgrade_tier_handler():
@@ -406,35 +700,37 @@ def upgrade_tier_handler():
         data = request.get_json()
         
         if not data or 'tier' not in data:
-            return jsonify({'error': 'Tier required'}), 400
+            return ojsonify({'error': 'Tier required'}, 400)
         
         tier = data['tier']
         if tier not in ['pro', 'enterprise']:
-            return jsonify({'error': 'Invalid tier'}), 400
+            return ojsonify({'error': 'Invalid tier'}, 400)
         
-        # Get current user
-        db_manager = DatabaseManager()
-        auth_manager = AuthManager(db_manager)
-        user = auth_manager.get_current_user()
+        # Load a fresh copy; the cached user is shared with other requests
+        auth_manager = get_auth_manager()
+        user_id = get_jwt_identity()
+        user = auth_manager.db_manager.get_user_by_id(user_id) if user_id else None
         
         if not user:
-            return jsonify({'error': 'User not found'}), 404
+            return ojsonify({'error': 'User not found'}, 404)
         
         # Update user tier (in production, this would be done after payment)
         user.subscription_tier = tier
         user.subscription_expires = datetime.utcnow() + timedelta(days=30)  # 30-day trial
         
-        db_manager.update_user(user)
+        if not auth_manager.db_manager.update_user(user):
+            return ojsonify({'error': 'Failed to upgrade tier'}, 500)
+        invalidate_cached_user(user.id)
         
-        return jsonify({
+        return ojsonify({
             'message': f'Upgraded to {tier} tier',
             'tier': tier,
-            'expires': user.subscription_expires.isoformat()
-        }), 200
+            'expires': user.subscription_expires
+        }, 200)
         
     except Exception as e:
         logger.error(f"Upgrade tier handler error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return ojsonify({'error': 'Internal server error'}, 500)
 
 
 # Initialize JWT with app
@@ -442,6 +738,36 @@ def init_jwt(app):
     """Initialize JWT with Flask app"""
     jwt.init_app(app)
     
+    # Share one database manager (and its connection pool) across requests
+    app.extensions['db_manager'] = DatabaseManager()
+    app.extensions['auth_manager'] = AuthManager(app.extensions['db_manager'])
+    
+    # Hash the unknown-email password now, so the first such login does
+    # not pay for a second bcrypt hash and stand out by its timing
+    _dummy_password_hash()
+    
+    # Expire subscriptions in one sweep instead of checking on every login
+    if 'subscription_sweeper' not in app.extensions and not app.testing:
+        sweeper_lock = _acquire_sweeper_lock()
+    else:
+        sweeper_lock = None
+    
+    if sweeper_lock is not None:
+        scheduler = BackgroundScheduler(daemon=True)
+        scheduler.add_job(
+            func=sweep_expired_subscriptions,
+            trigger=IntervalTrigger(seconds=SUBSCRIPTION_SWEEP_INTERVAL),
+            args=[app.extensions['db_manager']],
+            id='subscription_sweep',
+            name='Subscription Expiration Sweep',
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1
+        )
+        scheduler.start()
+        app.extensions['subscription_sweeper'] = scheduler
+        app.extensions['subscription_sweeper_lock'] = sweeper_lock
+    
     # Configure JWT
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
@@ -449,12 +775,12 @@ def init_jwt(app):
     # Add error handlers
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
-        return jsonify({'error': 'Token has expired'}), 401
+        return current_app.response_class(_EXPIRED[0], status=_EXPIRED[1], mimetype='application/json')
     
     @jwt.invalid_token_loader
     def invalid_token_callback(error):
-        return jsonify({'error': 'Invalid token'}), 401
+        return current_app.response_class(_INVALID[0], status=_INVALID[1], mimetype='application/json')
     
     @jwt.unauthorized_loader
     def missing_token_callback(error):
-        return jsonify({'error': 'Missing token'}), 401
\ No newline at end of file
+        return current_app.response_class(_MISSING[0], status=_MISSING[1], mimetype='application/json')
\ No newline at end of file
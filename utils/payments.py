@@ -5,18 +5,24 @@ This module provides Stripe payment integration for subscription management.
 """
 
 import os
+import importlib
 import logging
+import threading
+import time
 from datetime import datetime, timedelta
-from flask import request, jsonify
-import stripe
+from flask import request, current_app
+from cachetools import TTLCache
 from database.database_manager import DatabaseManager
 from database.models import User
-from utils.auth import AuthManager
+from utils.auth import AuthManager, get_db_manager, invalidate_cached_user, ojsonify
 
 logger = logging.getLogger(__name__)
 
-# Initialize Stripe
-stripe.api_key = os.getenv('STRIPE_SECRET_KEY', 'sk_test_your_test_key')
+# Open checkout sessions by (user_id, tier), so repeat upgrade clicks reuse
+# one session; Stripe keeps them valid for 24h, we reuse for at most 1h.
+# Each worker has its own cache, so reuse is confirmed with Stripe first
+_checkout_cache = TTLCache(maxsize=2000, ttl=3600)
+_checkout_cache_lock = threading.Lock()
 
 # Subscription prices (create these in your Stripe dashboard)
 SUBSCRIPTION_PRICES = {
@@ -38,9 +44,27 @@ SUBSCRIPTION_PRICES = {
 class PaymentManager:
     """Manages Stripe payments and subscriptions"""
     
+    # stripe module, imported by the first PaymentManager
+    _stripe = None
+    
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
         self.auth_manager = AuthManager(db_manager)
+        self.stripe = self._load_stripe()
+    
+    @classmethod
+    def _load_stripe(cls):
+        """
+        Import and configure stripe on first use
+        
+        stripe pulls in a large dependency graph that only the payment
+        routes need, so workers do not pay for it at boot.
+        """
+        if cls._stripe is None:
+            stripe = importlib.import_module('stripe')
+            stripe.api_key = os.getenv('STRIPE_SECRET_KEY', 'sk_test_your_test_key')
+            cls._stripe = stripe
+        return cls._stripe
     
     def create_checkout_session(self, user_id: int, tier: str):
         """
@@ -57,6 +81,17 @@ class PaymentManager:
             if tier not in SUBSCRIPTION_PRICES:
                 return {'error': 'Invalid tier'}, 400
             
+            # Reuse a session created for the same upgrade within the window,
+            # as long as it has not been completed or expired since
+            cache_key = (int(user_id), tier)
+            with _checkout_cache_lock:
+                cached = _checkout_cache.get(cache_key)
+            if cached is not None:
+                if self._checkout_session_open(cached['session_id']):
+                    return dict(cached)
+                with _checkout_cache_lock:
+                    _checkout_cache.pop(cache_key, None)
+            
             # Get user
             user = self.db_manager.get_user_by_id(user_id)
             if not user:
@@ -65,7 +100,7 @@ class PaymentManager:
             price_config = SUBSCRIPTION_PRICES[tier]
             
             # Create checkout session
-            session = stripe.checkout.Session.create(
+            session = self.stripe.checkout.Session.create(
                 customer_email=user.email,
                 payment_method_types=['card'],
                 line_items=[{
@@ -83,15 +118,39 @@ class PaymentManager:
             
             logger.info(f"Created checkout session for user {user_id}, tier {tier}")
             
-            return {
+            result = {
                 'session_id': session.id,
                 'url': session.url
             }
+            with _checkout_cache_lock:
+                _checkout_cache[cache_key] = result
+            return dict(result)
             
         except Exception as e:
             logger.error(f"Error creating checkout session: {e}")
             return {'error': 'Payment setup failed'}, 500
     
+    def _checkout_session_open(self, session_id: str) -> bool:
+        """
+        Check with Stripe that a checkout session can still be paid
+        
+        Only the worker that receives checkout.session.completed drops its
+        cache entry, so another worker may still hold a finished session.
+        
+        Args:
+            session_id: Stripe checkout session ID
+            
+        Returns:
+            bool: True if the session is open and not yet expired
+        """
+        try:
+            session = self.stripe.checkout.Session.retrieve(session_id)
+        except self.stripe.error.StripeError as e:
+            logger.warning(f"Could not check checkout session {session_id}: {e}")
+            return False
+        
+        return session.status == 'open' and session.expires_at > time.time()
+    
     def handle_webhook(self, payload: bytes, sig_header: str):
         """
         Handle Stripe webhook events
@@ -107,12 +166,14 @@ class PaymentManager:
             webhook_secret = os.getenv('STRIPE_WEBHOOK_SECRET', 'whsec_your_webhook_secret')
             
             # Verify webhook signature
-            event = stripe.Webhook.construct_event(
+            event = self.stripe.Webhook.construct_event(
                 payload, sig_header, webhook_secret
             )
             
             # Handle different event types
             if event['type'] == 'checkout.session.completed':
+                # Processed before acknowledging, so a failed upgrade gets an
+                # error status and Stripe delivers the event again
                 return self._handle_checkout_completed(event['data']['object'])
             elif event['type'] == 'invoice.payment_succeeded':
                 return self._handle_payment_succeeded(event['data']['object'])
@@ -134,20 +195,23 @@ class PaymentManager:
             user_id = int(session['metadata']['user_id'])
             tier = session['metadata']['tier']
             
+            # The session is used up, so the next upgrade gets a new one
+            with _checkout_cache_lock:
+                _checkout_cache.pop((user_id, tier), None)
+            
             # Update user subscription
             user = self.db_manager.get_user_by_id(user_id)
             if user:
                 user.subscription_tier = tier
                 user.subscription_expires = datetime.utcnow() + timedelta(days=30)
                 
-                # Store Stripe customer ID
+                # Store Stripe customer and subscription IDs
                 if 'customer' in session:
-                    user.raw_data = str({
-                        'stripe_customer_id': session['customer'],
-                        'subscription_id': session.get('subscription')
-                    })
+                    user.stripe_customer_id = session['customer']
+                    user.subscription_id = session.get('subscription')
                 
                 self.db_manager.update_user(user)
+                invalidate_cached_user(user_id)
                 
                 logger.info(f"User {user_id} upgraded to {tier} tier")
                 
@@ -155,7 +219,7 @@ class PaymentManager:
             
         except Exception as e:
             logger.error(f"Error handling checkout completion: {e}")
-            return {'error': 'Failed to process checkout'}
+            return {'error': 'Failed to process checkout'}, 500
     
     def _handle_payment_succeeded(self, invoice):
         """Handle successful payment"""
@@ -204,13 +268,12 @@ class PaymentManager:
             if not user:
                 return {'error': 'User not found'}, 404
             
-            # Get subscription ID from user data
-            raw_data = eval(user.raw_data) if user.raw_data else {}
-            subscription_id = raw_data.get('subscription_id')
+            # Stripe subscription saved at checkout
+            subscription_id = user.subscription_id
             
             if subscription_id:
                 # Cancel in Stripe
-                stripe.Subscription.modify(subscription_id, cancel_at_period_end=True)
+                self.stripe.Subscription.modify(subscription_id, cancel_at_period_end=True)
                 
                 logger.info(f"Cancelled subscription {subscription_id} for user {user_id}")
                 
@@ -223,6 +286,14 @@ class PaymentManager:
             return {'error': 'Failed to cancel subscription'}, 500
 
 
+def get_payment_manager() -> PaymentManager:
+    """Get the app-wide PaymentManager, creating it on first use"""
+    extensions = current_app.extensions
+    if 'payment_manager' not in extensions:
+        extensions['payment_manager'] = PaymentManager(get_db_manager())
+    return extensions['payment_manager']
+
+
 # Flask route handlers
 def create_subscription_handler():
     """Handle subscription creation"""
@@ -230,34 +301,32 @@ def create_subscription_handler():
         data = request.get_json()
         
         if not data or 'tier' not in data:
-            return jsonify({'error': 'Tier required'}), 400
+            return ojsonify({'error': 'Tier required'}, 400)
         
         tier = data['tier']
         if tier not in ['pro', 'enterprise']:
-            return jsonify({'error': 'Invalid tier'}), 400
+            return ojsonify({'error': 'Invalid tier'}, 400)
         
         # Get current user
         from utils.auth import get_jwt_identity
         user_id = get_jwt_identity()
         
         if not user_id:
-            return jsonify({'error': 'Authentication required'}), 401
+            return ojsonify({'error': 'Authentication required'}, 401)
         
-        # Create payment manager
-        db_manager = DatabaseManager()
-        payment_manager = PaymentManager(db_manager)
+        payment_manager = get_payment_manager()
         
         # Create checkout session
         result = payment_manager.create_checkout_session(user_id, tier)
         
         if isinstance(result, tuple):
-            return jsonify(result[0]), result[1]
+            return ojsonify(result[0], result[1])
         else:
-            return jsonify(result)
+            return ojsonify(result)
             
     except Exception as e:
         logger.error(f"Subscription creation error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return ojsonify({'error': 'Internal server error'}, 500)
 
 
 def webhook_handler():
@@ -267,23 +336,21 @@ def webhook_handler():
         sig_header = request.headers.get('Stripe-Signature')
         
         if not sig_header:
-            return jsonify({'error': 'Missing signature'}), 400
+            return ojsonify({'error': 'Missing signature'}, 400)
         
-        # Create payment manager
-        db_manager = DatabaseManager()
-        payment_manager = PaymentManager(db_manager)
+        payment_manager = get_payment_manager()
         
         # Process webhook
         result = payment_manager.handle_webhook(payload, sig_header)
         
         if isinstance(result, tuple):
-            return jsonify(result[0]), result[1]
+            return ojsonify(result[0], result[1])
         else:
-            return jsonify(result)
+            return ojsonify(result)
             
     except Exception as e:
         logger.error(f"Webhook handler error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
+        return ojsonify({'error': 'Internal server error'}, 500)
 
 
 def cancel_subscription_handler():
@@ -294,20 +361,18 @@ def cancel_subscription_handler():
         user_id = get_jwt_identity()
         
         if not user_id:
-            return jsonify({'error': 'Authentication required'}), 401
+            return ojsonify({'error': 'Authentication required'}, 401)
         
-        # Create payment manager
-        db_manager = DatabaseManager()
-        payment_manager = PaymentManager(db_manager)
+        payment_manager = get_payment_manager()
         
         # Cancel subscription
         result = payment_manager.cancel_subscription(user_id)
         
         if isinstance(result, tuple):
-            return jsonify(result[0]), result[1]
+            return ojsonify(result[0], result[1])
         else:
-            return jsonify(result)
+            return ojsonify(result)
             
     except Exception as e:
         logger.error(f"Subscription cancellation error: {e}")
-        return jsonify({'error': 'Internal server error'}), 500
\ No newline at end of file
+        return ojsonify({'error': 'Internal server error'}, 500)
\ No newline at end of file
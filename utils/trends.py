@@ -4,28 +4,302 @@ Price Trend Analysis Module
 This module provides price trend analysis functionality using basic ML techniques.
 """
 
+import threading
+from collections import OrderedDict
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
+from scipy import stats
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy import text
 from database.models import PropertyListing, Base
 from database.database_manager import DatabaseManager
 import logging
 
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+try:
+    # Ahead-of-time build of _group_moments_numba, see utils/_trend_kernel.py
+    from utils import trend_kernel
+except ImportError:
+    trend_kernel = None
+
 logger = logging.getLogger(__name__)
 
+NS_PER_DAY = 86_400_000_000_000
+
+# Rows fetched per round trip when streaming listings
+READ_CHUNK_SIZE = 50_000
+
+# Arrow-backed string columns factorize in C instead of hashing Python str
+READ_SQL_OPTIONS = {'dtype_backend': 'pyarrow'} if pyarrow is not None else {}
+
+# Listings in the analysis window, in (location, timestamp) index order
+TRENDS_SQL = """
+    SELECT timestamp, location, price_per_m2
+    FROM property_listings
+    WHERE timestamp >= :cutoff
+    ORDER BY location, timestamp
+"""
+
+# Locations with fewer listings get a Theil–Sen fit, which one outlier
+# cannot swing the way it swings OLS
+THEIL_SEN_MAX_POINTS = 50
+
+# Trend results kept per analyzer, oldest evicted first
+TREND_CACHE_SIZE = 8
+
+# Flag listings priced below threshold * their location's average (from
+# location_stats), for locations with at least 5 listings. Rows whose flag
+# and score would not change are left untouched. Sticks to correlated
+# subqueries and <> / IS NULL so it runs on any SQLite with CTEs (3.8.3+)
+# as well as PostgreSQL; ROUND takes NUMERIC on PostgreSQL.
+FLAG_DEALS_SQL = """
+    WITH flags AS (
+        SELECT listings.id,
+            listings.price_per_m2 < stats.avg_price * :threshold AS is_deal,
+            CASE
+                WHEN listings.price_per_m2 < stats.avg_price * :threshold
+                THEN ROUND(CAST((stats.avg_price - listings.price_per_m2) / stats.avg_price * 100 AS NUMERIC), 1)
+                ELSE NULL
+            END AS deal_score
+        FROM property_listings AS listings
+        JOIN location_stats AS stats ON listings.location = stats.location
+        WHERE stats.n >= 5
+    )
+    UPDATE property_listings
+    SET is_deal = (SELECT flags.is_deal FROM flags WHERE flags.id = property_listings.id),
+        deal_score = (SELECT flags.deal_score FROM flags WHERE flags.id = property_listings.id)
+    WHERE EXISTS (
+        SELECT 1 FROM flags
+        WHERE flags.id = property_listings.id
+          AND (property_listings.is_deal <> flags.is_deal
+               OR (property_listings.is_deal IS NULL) <> (flags.is_deal IS NULL)
+               OR property_listings.deal_score <> flags.deal_score
+               OR (property_listings.deal_score IS NULL) <> (flags.deal_score IS NULL))
+    )
+"""
+
+
+def _group_moments_numpy(days: np.ndarray, y: np.ndarray, starts: np.ndarray):
+    """
+    Per-group count, means and centred sums of squares and products
+    
+    Inputs may be float32; every sum is accumulated in float64.
+    
+    Args:
+        days: Days since each group's first listing
+        y: Price per m² for each row
+        starts: Offset of the first row of each group
+        
+    Returns:
+        tuple: n, mean_x, mean_y, sxx, sxy, syy arrays (float64), one entry per group
+    """
+    n = np.diff(np.r_[starts, len(y)])
+    group_rows = np.repeat(np.arange(len(starts)), n)
+    
+    mean_x = np.add.reduceat(days, starts, dtype=np.float64) / n
+    mean_y = np.add.reduceat(y, starts, dtype=np.float64) / n
+    
+    # Centre each group before summing products so large prices do not
+    # cancel out in Σy² - (Σy)²/n
+    dx = days - mean_x[group_rows]
+    dy = y - mean_y[group_rows]
+    sxx = np.add.reduceat(dx * dx, starts)
+    sxy = np.add.reduceat(dx * dy, starts)
+    syy = np.add.reduceat(dy * dy, starts)
+    
+    return n, mean_x, mean_y, sxx, sxy, syy
+
+
+if numba is not None:
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _group_moments_numba(days, y, starts):
+        """
+        Same result as _group_moments_numpy, in one fused pass over the rows
+        
+        Groups run in parallel; each is reduced with Welford's update, which
+        stays centred without a separate pass for the means. Locals are
+        float64 whatever the input width.
+        
+        utils/_trend_kernel.py compiles this function ahead of time, and a
+        built utils/trend_kernel module is used in its place. Rebuild it
+        (python -m utils._trend_kernel) whenever this function changes.
+        """
+        n_groups = starts.shape[0]
+        total = y.shape[0]
+        n = np.empty(n_groups, dtype=np.int64)
+        mean_x = np.empty(n_groups)
+        mean_y = np.empty(n_groups)
+        sxx = np.empty(n_groups)
+        sxy = np.empty(n_groups)
+        syy = np.empty(n_groups)
+        
+        for g in numba.prange(n_groups):
+            end = starts[g + 1] if g + 1 < n_groups else total
+            count = 0
+            mx = 0.0
+            my = 0.0
+            xx = 0.0
+            xy = 0.0
+            yy = 0.0
+            for i in range(starts[g], end):
+                count += 1
+                dx = days[i] - mx
+                dy = y[i] - my
+                mx += dx / count
+                my += dy / count
+                xx += dx * (days[i] - mx)
+                xy += dx * (y[i] - my)
+                yy += dy * (y[i] - my)
+            
+            n[g] = count
+            mean_x[g] = mx
+            mean_y[g] = my
+            sxx[g] = xx
+            sxy[g] = xy
+            syy[g] = yy
+        
+        return n, mean_x, mean_y, sxx, sxy, syy
+    
+    # numba's default workqueue threading layer aborts the process when two
+    # threads enter a parallel kernel at once, and request threads share one
+    # PriceTrendAnalyzer, so calls take turns; each still uses every core
+    _group_moments_numba_lock = threading.Lock()
+    
+    def _group_moments_numba_serialized(days, y, starts):
+        """Run _group_moments_numba with one caller at a time"""
+        with _group_moments_numba_lock:
+            return _group_moments_numba(days, y, starts)
+
+
+# Prefer the AOT build, then the JIT kernel, then NumPy. The AOT build
+# runs groups serially, so it is safe to call from several threads
+if trend_kernel is not None:
+    # Takes float32 days and prices, as _trends_from_rows passes them
+    _group_moments = trend_kernel.group_moments
+elif numba is not None:
+    _group_moments = _group_moments_numba_serialized
+else:
+    _group_moments = _group_moments_numpy
+
+
+def _theil_sen(x: np.ndarray, y: np.ndarray) -> tuple:
+    """
+    Theil–Sen line through one small group
+    
+    The slope is the median of the slopes between every pair of points with
+    different x, and the intercept is median(y) - slope * median(x), as in
+    scipy.stats.theilslopes. The p-value is Kendall's tau test.
+    
+    Args:
+        x: Days since the group's first listing
+        y: Price per m² for each row
+        
+    Returns:
+        tuple: slope, intercept, p_value, r_squared
+    """
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    
+    i, j = np.triu_indices(len(x), k=1)
+    dx = x[j] - x[i]
+    has_spread = dx != 0
+    if has_spread.any():
+        slope = float(np.median((y[j] - y[i])[has_spread] / dx[has_spread]))
+        intercept = float(np.median(y) - slope * np.median(x))
+        p_value = stats.kendalltau(x, y).pvalue
+    else:
+        # All listings on the same day, same as the OLS branch
+        slope, intercept, p_value = 0.0, float(y.mean()), np.nan
+    
+    dy = y - y.mean()
+    resid = y - (intercept + slope * x)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = 1.0 - np.dot(resid, resid) / np.dot(dy, dy)
+    
+    return slope, intercept, p_value, r_squared
+
+
+def _fit_group_trends(days: np.ndarray, y: np.ndarray, starts: np.ndarray) -> dict:
+    """
+    Fit y = intercept + slope * days for every group at once
+    
+    Rows must be sorted so each group is contiguous. All groups are reduced
+    together by _group_moments (the AOT-built utils.trend_kernel if present,
+    else the numba JIT kernel if numba is installed, else np.add.reduceat)
+    and solved by OLS in closed form, instead of one statsmodels fit per group.
+    Groups of 3 up to THEIL_SEN_MAX_POINTS rows are then refitted with
+    Theil–Sen on slices of the sorted arrays.
+    
+    Args:
+        days: Days since each group's first listing (float32; the AOT kernel
+            accepts nothing else)
+        y: Price per m² for each row (float32, as for days)
+        starts: Offset of the first row of each group
+        
+    Returns:
+        dict: Per-group arrays of n, slope, intercept, p_value, r_squared,
+            mean and std
+    """
+    n, mean_x, mean_y, sxx, sxy, syy = _group_moments(days, y, starts)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # All listings on the same day: no slope to fit, same as statsmodels' pinv
+        has_spread = sxx > 0
+        slope = np.where(has_spread, sxy / sxx, 0.0)
+        intercept = mean_y - slope * mean_x
+        ssr = np.maximum(syy - slope * sxy, 0.0)
+        r_squared = 1.0 - ssr / syy
+        
+        dof = n - 2
+        t_stat = slope / np.sqrt(ssr / dof / sxx)
+        p_value = np.where(has_spread, 2.0 * stats.t.sf(np.abs(t_stat), dof), np.nan)
+        std = np.sqrt(syy / (n - 1))
+    
+    # Groups with 2 rows or fewer are never reported, so skip them here
+    for g in np.flatnonzero((n > 2) & (n < THEIL_SEN_MAX_POINTS)):
+        rows = slice(starts[g], starts[g] + n[g])
+        slope[g], intercept[g], p_value[g], r_squared[g] = _theil_sen(days[rows], y[rows])
+    
+    return {
+        'n': n,
+        'slope': slope,
+        'intercept': intercept,
+        'p_value': p_value,
+        'r_squared': r_squared,
+        'mean': mean_y,
+        'std': std
+    }
+
 
 class PriceTrendAnalyzer:
     """Analyzes price trends and identifies deals"""
     
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
+        # Server-side cursor for analytics reads (PostgreSQL named cursor),
+        # buffering at most one chunk of rows at a time
+        self.read_engine = db_manager.engine.execution_options(
+            stream_results=True, max_row_buffer=READ_CHUNK_SIZE
+        )
+        self._trend_cache = OrderedDict()
+        self._trend_cache_lock = threading.Lock()
     
     def calculate_price_trends(self, days_back=30):
         """
         Calculate price trends for each location
         
+        Rows are streamed in location order, so each location's rows arrive
+        together and are fitted as soon as the next location starts.
+        
         Args:
             days_back: Number of days to look back for trend analysis
             
@@ -33,56 +307,58 @@ class PriceTrendAnalyzer:
             dict: Trends data for each location
         """
         try:
-            # Get data from database
-            engine = self.db_manager.engine
             cutoff_date = datetime.utcnow() - timedelta(days=days_back)
             
-            query = f"""
-                SELECT timestamp, location, price_per_m2 
-                FROM property_listings 
-                WHERE timestamp >= '{cutoff_date.isoformat()}'
-                ORDER BY timestamp
-            """
+            # Trends only change when listings in the window change, which one
+            # aggregate query can tell before any rows are read
+            with self.db_manager.engine.connect() as conn:
+                window_state = tuple(conn.execute(
+                    text("SELECT MAX(timestamp), COUNT(*) FROM property_listings WHERE timestamp >= :cutoff"),
+                    {'cutoff': cutoff_date}
+                ).one())
             
-            df = pd.read_sql(query, engine)
-            
-            if df.empty:
-                logger.warning("No data found for trend analysis")
-                return {}
+            cache_key = (days_back, window_state)
+            with self._trend_cache_lock:
+                cached = self._trend_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
             trends = {}
+            carry = None
+            
+            # float32 prices halve the memory the reductions stream through;
+            # the sums themselves are kept in float64
+            chunks = pd.read_sql(
+                text(TRENDS_SQL),
+                self.read_engine,
+                params={'cutoff': cutoff_date},
+                chunksize=READ_CHUNK_SIZE,
+                dtype={'price_per_m2': np.float32},
+                **READ_SQL_OPTIONS
+            )
+            for chunk in chunks:
+                # An empty window still yields one empty chunk
+                if chunk.empty:
+                    continue
+                
+                if carry is not None:
+                    chunk = pd.concat([carry, chunk], ignore_index=True)
+                
+                # The last location may continue in the next chunk
+                is_last = (chunk['location'] == chunk['location'].iloc[-1]).to_numpy()
+                carry = chunk[is_last]
+                trends.update(self._trends_from_rows(chunk[~is_last]))
+            
+            if carry is not None:
+                trends.update(self._trends_from_rows(carry))
+            
+            if not trends and carry is None:
+                logger.warning("No data found for trend analysis")
             
-            # Calculate trends for each location
-            for loc, group in df.groupby('location'):
-                if len(group) > 2:  # Need at least 3 data points
-                    try:
-                        # Convert timestamps to days since first listing
-                        first_date = group['timestamp'].min()
-                        days = (group['timestamp'] - first_date).dt.days.values.reshape(-1, 1)
-                        y = group['price_per_m2'].values
-                        
-                        # Add constant for intercept
-                        X = sm.add_constant(days)
-                        
-                        # Fit OLS model
-                        model = sm.OLS(y, X).fit()
-                        
-                        trends[loc] = {
-                            'slope': float(model.params[1]),
-                            'intercept': float(model.params[0]),
-                            'p_value': float(model.pvalues[1]),
-                            'r_squared': float(model.rsquared),
-                            'data_points': len(group),
-                            'avg_price': float(group['price_per_m2'].mean()),
-                            'std_price': float(group['price_per_m2'].std())
-                        }
-                        
-                        logger.info(f"Trend calculated for {loc}: slope={trends[loc]['slope']:.2f}, R²={trends[loc]['r_squared']:.3f}")
-                        
-                    except Exception as e:
-                        logger.error(f"Error calculating trend for {loc}: {e}")
-                        continue
+            with self._trend_cache_lock:
+                self._trend_cache[cache_key] = trends
+                if len(self._trend_cache) > TREND_CACHE_SIZE:
+                    self._trend_cache.popitem(last=False)
             
             return trends
             
@@ -90,69 +366,75 @@ class PriceTrendAnalyzer:
             logger.error(f"Error in calculate_price_trends: {e}")
             return {}
     
+    def _trends_from_rows(self, df: pd.DataFrame) -> dict:
+        """
+        Fit trends for rows sorted by location, then timestamp
+        
+        Args:
+            df: Rows with timestamp, location and price_per_m2 columns
+            
+        Returns:
+            dict: Trends data for each location with at least 3 data points
+        """
+        df = df.dropna(subset=['location', 'price_per_m2'])
+        if df.empty:
+            return {}
+        
+        # Group boundaries in the location-sorted rows
+        codes, locations = pd.factorize(df['location'])
+        starts = np.flatnonzero(np.r_[True, np.diff(codes) != 0])
+        
+        # Whole days since each location's first listing. SQLite hands back
+        # text; ISO8601 parses it in C even when only some rows carry
+        # microseconds, where an inferred format raises or falls back to dateutil
+        ts = pd.to_datetime(df['timestamp'], format='ISO8601').values.astype('datetime64[ns]').astype(np.int64)
+        counts = np.diff(np.r_[starts, len(ts)])
+        days = ((ts - np.repeat(ts[starts], counts)) // NS_PER_DAY).astype(np.float32)
+        y = df['price_per_m2'].to_numpy(dtype=np.float32)
+        
+        fit = _fit_group_trends(days, y, starts)
+        trends = {}
+        
+        # Need at least 3 data points
+        for i in np.flatnonzero(fit['n'] > 2):
+            loc = locations[i]
+            trends[loc] = {
+                'slope': float(fit['slope'][i]),
+                'intercept': float(fit['intercept'][i]),
+                'p_value': float(fit['p_value'][i]),
+                'r_squared': float(fit['r_squared'][i]),
+                'data_points': int(fit['n'][i]),
+                'avg_price': float(fit['mean'][i]),
+                'std_price': float(fit['std'][i])
+            }
+            
+            logger.info(f"Trend calculated for {loc}: slope={trends[loc]['slope']:.2f}, R²={trends[loc]['r_squared']:.3f}")
+        
+        return trends
+    
     def flag_deals(self, deal_threshold=0.8):
         """
         Flag listings as deals based on price comparison
         
+        The whole comparison runs as one UPDATE in the database, so no
+        listing rows are sent to Python. Location averages are read from
+        location_stats, which DatabaseManager adds to as listings are
+        inserted and run_trend_analysis reconciles beforehand.
+        
         Args:
             deal_threshold: Threshold below average to consider a deal (0.8 = 80% of avg)
+            
+        Returns:
+            int: Number of listings flagged as deals
         """
         try:
-            # Get average prices by location
-            engine = self.db_manager.engine
-            avg_query = """
-                SELECT location, AVG(price_per_m2) as avg_price, COUNT(*) as count
-                FROM property_listings 
-                GROUP BY location
-                HAVING COUNT(*) >= 5
-            """
-            
-            avg_df = pd.read_sql(avg_query, engine)
-            avg_prices = dict(zip(avg_df['location'], avg_df['avg_price']))
-            
-            # Get all listings
-            session = Session(engine)
-            listings = session.query(PropertyListing).all()
-            
-            deals_found = 0
-            for listing in listings:
-                avg_price = avg_prices.get(listing.location)
-                if avg_price:
-                    # Check if this is a deal
-                    if listing.price_per_m2 < avg_price * deal_threshold:
-                        # Add deal flag to raw_data
-                        raw_data = {}
-                        if listing.raw_data:
-                            try:
-                                raw_data = eval(listing.raw_data) if isinstance(listing.raw_data, str) else listing.raw_data
-                            except:
-                                raw_data = {}
-                        
-                        raw_data['is_deal'] = True
-                        raw_data['deal_score'] = round((avg_price - listing.price_per_m2) / avg_price * 100, 1)
-                        raw_data['avg_price_location'] = avg_price
-                        
-                        listing.raw_data = str(raw_data)
-                        deals_found += 1
-                    else:
-                        # Remove deal flag if exists
-                        raw_data = {}
-                        if listing.raw_data:
-                            try:
-                                raw_data = eval(listing.raw_data) if isinstance(listing.raw_data, str) else listing.raw_data
-                            except:
-                                raw_data = {}
-                        
-                        if 'is_deal' in raw_data:
-                            del raw_data['is_deal']
-                            del raw_data['deal_score']
-                            del raw_data['avg_price_location']
-                            listing.raw_data = str(raw_data)
-            
-            session.commit()
-            session.close()
-            
-            logger.info(f"Flagged {deals_found} deals out of {len(listings)} listings")
+            with self.db_manager.engine.begin() as conn:
+                conn.execute(text(FLAG_DEALS_SQL), {'threshold': deal_threshold})
+                deals_found = conn.execute(
+                    text("SELECT COUNT(*) FROM property_listings WHERE is_deal")
+                ).scalar()
+            
+            logger.info(f"Flagged {deals_found} deals")
             return deals_found
             
         except Exception as e:
@@ -166,17 +448,19 @@ class PriceTrendAnalyzer:
         if not trends:
             return {"message": "No trend data available"}
         
+        items = list(trends.items())
+        slopes = np.fromiter((t['slope'] for _, t in items), dtype=np.float64, count=len(items))
+        
         # Calculate overall market direction
-        slopes = [t['slope'] for t in trends.values()]
-        avg_slope = np.mean(slopes)
+        avg_slope = float(slopes.mean())
         
         # Count locations with positive/negative trends
-        positive_trends = sum(1 for slope in slopes if slope > 0)
-        negative_trends = sum(1 for slope in slopes if slope < 0)
+        positive_trends = int((slopes > 0).sum())
+        negative_trends = int((slopes < 0).sum())
         
         # Find best and worst performing locations
-        best_location = max(trends.items(), key=lambda x: x[1]['slope'])
-        worst_location = min(trends.items(), key=lambda x: x[1]['slope'])
+        best_location = items[int(slopes.argmax())]
+        worst_location = items[int(slopes.argmin())]
         
         return {
             "market_direction": "up" if avg_slope > 0 else "down",
@@ -208,7 +492,8 @@ def run_trend_analysis():
         trends = analyzer.calculate_price_trends()
         logger.info(f"Calculated trends for {len(trends)} locations")
         
-        # Flag deals
+        # Reconcile location statistics, then flag deals against them
+        db_manager.refresh_location_stats()
         deals_found = analyzer.flag_deals()
         logger.info(f"Flagged {deals_found} deals")
         